@@ -1,2 +1,2 @@
-from .codec import Codec, CustomTypeCodec, CustomNameSpace, EncodedCustomType, NamespaceModule
+from .codec import Codec, CustomTypeCodec, CustomNameSpace, EncodedCustomType, LazyType, NamespaceModule
 from .intern_table import InternTable, InternContext, InternPtr, Intern
\ No newline at end of file
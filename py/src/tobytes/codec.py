@@ -1,5 +1,9 @@
+import dataclasses
 import msgpack
+import struct
+import sys
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Optional
 
@@ -8,12 +12,111 @@ from .intern_table import (
     InternContext,
     InternPtr,
     Intern,
-    INTERN_TABLE_EXT
+    INTERN_TABLE_EXT,
+    _UINT_FORMATS,
 )
 
 
+NAMESPACE_ID_EXT = 7
 CUSTOM_TYPE_EXT = 8
 
+# Values of these types are packed directly by msgpack, without intern tables or custom types
+_SCALAR_TYPES = frozenset({str, int, float, bool, bytes, type(None)})
+
+# Objects exposing at least this many nbytes are encoded on the worker pool (see Codec io_workers)
+PARALLEL_ENCODE_MIN_BYTES = 1 << 20
+
+# Limit on the total nbytes of objects pre-encoded on the worker pool for one message.  Their
+# encoded payloads are all held until packing finishes, so this bounds the extra peak memory;
+# large objects beyond it are encoded serially while packing.
+PARALLEL_ENCODE_MAX_BYTES = 1 << 30
+
+# Messages up to this size have their unshared intern references inlined rather than being
+# wrapped in an intern table
+INLINE_INTERNS_MAX_BYTES = 1 << 14
+
+# Maximum number of concrete types whose subtype codec match is remembered per Codec
+SUBTYPE_MATCH_CACHE_SIZE = 256
+
+_STR_LENGTH_FORMATS = {
+    0xd9: struct.Struct('>B'),
+    0xda: struct.Struct('>H'),
+    0xdb: struct.Struct('>I'),
+}
+
+
+def _read_namespace_header(data: bytes) -> tuple[str | int, int, int]:
+    """Read the namespace and id prefix of a custom type or namespace id payload.
+
+    The namespace may be a string or an integer namespace id. The common
+    string/uint encodings are parsed inline, anything else falls back to a
+    msgpack Unpacker.
+
+    Returns:
+        tuple[str | int, int, int]: (namespace, id, offset) where offset is the
+                                    start of the remaining payload data
+    """
+    marker = data[0]
+    if marker < 0x80:
+        namespace = marker
+        end = 1
+    else:
+        if 0xa0 <= marker <= 0xbf:
+            offset = 1
+            length = marker & 0x1f
+        elif marker in _STR_LENGTH_FORMATS:
+            fmt = _STR_LENGTH_FORMATS[marker]
+            offset = 1 + fmt.size
+            length = fmt.unpack_from(data, 1)[0]
+        else:
+            return _unpack_namespace_header(data)
+
+        end = offset + length
+        if end >= len(data):
+            return _unpack_namespace_header(data)
+        namespace = bytes(data[offset:end]).decode('utf-8')
+
+    marker = data[end]
+    if marker < 0x80:
+        return namespace, marker, end + 1
+    if marker in _UINT_FORMATS:
+        fmt = _UINT_FORMATS[marker]
+        return namespace, fmt.unpack_from(data, end + 1)[0], end + 1 + fmt.size
+    return _unpack_namespace_header(data)
+
+
+def _string_header_length(data: bytes) -> Optional[int]:
+    """Return the byte length of a (string namespace, uint id) header without decoding it.
+
+    Returns None if the header is not in that form.
+    """
+    marker = data[0]
+    if 0xa0 <= marker <= 0xbf:
+        end = 1 + (marker & 0x1f)
+    elif marker in _STR_LENGTH_FORMATS:
+        fmt = _STR_LENGTH_FORMATS[marker]
+        end = 1 + fmt.size + fmt.unpack_from(data, 1)[0]
+    else:
+        return None
+
+    if end >= len(data):
+        return None
+    marker = data[end]
+    if marker < 0x80:
+        return end + 1
+    if marker in _UINT_FORMATS:
+        return end + 1 + _UINT_FORMATS[marker].size
+    return None
+
+
+def _unpack_namespace_header(data: bytes) -> tuple[str | int, int, int]:
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(data)
+
+    namespace = next(unpacker)
+    type_id = next(unpacker)
+    return namespace, type_id, unpacker.tell()
+
 
 @dataclass
 class EncodedCustomType:
@@ -22,13 +125,36 @@ class EncodedCustomType:
     data: bytes
 
 
-@dataclass
+@dataclass(frozen=True)
+class LazyType:
+    """Placeholder py_type for a type whose module should only be imported when needed.
+
+    Objects of the type can only exist once something else has imported its module,
+    so codecs resolve the type from sys.modules the first time an unknown object is seen.
+    """
+    module: str
+    name: str
+
+    def resolve(self) -> Optional[type]:
+        module = sys.modules.get(self.module)
+        if module is None:
+            return None
+        return getattr(module, self.name, None)
+
+
+# Frozen: codecs returned by NamespaceModule.custom_types() are shared by every Codec using them
+@dataclass(frozen=True)
 class CustomTypeCodec:
-    py_type: type
+    py_type: type | LazyType
+    # May return any bytes-like object, which is copied once into the custom type payload
     encoder: Callable[['Codec', object], bytes]
-    decoder: Callable[['Codec', bytes], object]
-    
+    # Receives the payload body as a memoryview, so it is not copied out of the message
+    decoder: Callable[['Codec', memoryview], object]
+    match_subtypes: bool = False
+
     def matches(self, obj: object) -> bool:
+        if self.match_subtypes:
+            return isinstance(obj, self.py_type)
         return type(obj) is self.py_type
         
 
@@ -48,65 +174,81 @@ class NamespaceModule:
 
     @dataclass
     class TypeCodec:
-        py_type: type
+        py_type: type | LazyType
         type_id: int
         encoder: Optional[Callable[['Codec', object], bytes]] = None
         decoder: Optional[Callable[['Codec', bytes], object]] = None
+        match_subtypes: bool = False
 
     def __init__(self, name: str):
         self.name = name
         self.codecs = []
+        self._used_ids = set()
+        self._custom_types = None
 
     def _check_unique_id(self, type_id: int):
-        for codec in self.codecs:
-            if codec.type_id == type_id:
-                raise ValueError(f"Type ID {type_id} is already used in namespace '{self.name}'")
+        if type_id in self._used_ids:
+            raise ValueError(f"Type ID {type_id} is already used in namespace '{self.name}'")
 
-    def encoder(self, py_type: type, type_id: int):
+    def _register(self, codec: 'NamespaceModule.TypeCodec'):
+        self.codecs.append(codec)
+        self._used_ids.add(codec.type_id)
+        self._custom_types = None
+
+    def encoder(self, py_type: type | LazyType, type_id: int, match_subtypes: bool = False):
         self._check_unique_id(type_id)
         codec = self.TypeCodec(
             py_type=py_type,
             type_id=type_id,
+            match_subtypes=match_subtypes,
         )
-        self.codecs.append(codec)
+        self._register(codec)
 
         def decorate_decode_fn(decode_fn: Callable[['Codec', object], bytes]):
             codec.decoder = decode_fn
+            self._custom_types = None
             return decode_fn
         
         def decorate_encode_fn(encode_fn: Callable[['Codec', bytes], object]):
             codec.encoder = encode_fn # type: ignore
+            self._custom_types = None
             encode_fn.decoder = decorate_decode_fn
             return encode_fn
         return decorate_encode_fn
     
-    def decoder(self, py_type: type, type_id: int):
+    def decoder(self, py_type: type | LazyType, type_id: int, match_subtypes: bool = False):
         self._check_unique_id(type_id)
         codec = self.TypeCodec(
             py_type=py_type,
             type_id=type_id,
+            match_subtypes=match_subtypes,
         )
-        self.codecs.append(codec)
+        self._register(codec)
 
         def decorate_encode_fn(encode_fn: Callable[['Codec', object], bytes]):
             codec.encoder = encode_fn
+            self._custom_types = None
             return encode_fn
         
         def decorate_decode_fn(decode_fn: Callable[['Codec', bytes], object]):
             codec.decoder = decode_fn
+            self._custom_types = None
             decode_fn.encoder = decorate_encode_fn
             return decode_fn
         return decorate_decode_fn
     
     def custom_types(self) -> dict[int, CustomTypeCodec]:
-        result = {}
-        for codec in self.codecs:
-            result[codec.type_id] = CustomTypeCodec(
-                py_type=codec.py_type,
-                encoder=codec.encoder,
-                decoder=codec.decoder,
-            )
-        return result
+        if self._custom_types is None:
+            self._custom_types = {
+                codec.type_id: CustomTypeCodec(
+                    py_type=codec.py_type,
+                    encoder=codec.encoder,
+                    decoder=codec.decoder,
+                    match_subtypes=codec.match_subtypes,
+                )
+                for codec in self.codecs
+            }
+        return dict(self._custom_types)
 
 Namespace = dict[int, CustomTypeCodec] | CustomNameSpace
 Namespaces = dict[str, Namespace]
@@ -114,86 +256,279 @@ Namespaces = dict[str, Namespace]
 
 class Codec:
 
-    def __init__(self, namespaces: Optional[Namespaces]=None):
+    # Lookup tables built by _reset_type_map/_index_namespace.  New instances share the
+    # default namespaces' tables, and copy them before their first registration.
+    _TYPE_MAP_ATTRS = (
+        '_type_map', '_header_cache', '_fast_encoders', '_fast_decoders', '_subtype_codecs',
+        '_subtype_types', '_custom_namespaces', '_lazy_codecs', '_ns_to_id', '_namespace_headers',
+    )
+
+    # compact_headers -> (default namespaces, lookup tables)
+    _default_states: dict = {}
+
+    def __init__(self, namespaces: Optional[Namespaces]=None, compact_headers: bool=False, io_workers: int=0, zero_copy_decode: bool=False):
+        """
+        Args:
+            namespaces: Additional namespaces to register alongside the defaults
+            compact_headers: If True, custom types are encoded with integer namespace
+                ids, and the message is wrapped in namespace id mappings (Ext 7)
+            io_workers: If non-zero, large buffer objects (e.g. numpy arrays) found in
+                dicts/lists/tuples are encoded in parallel on a pool of this many threads.
+                Their encoders must be thread-safe.  The encoded payloads are held until the
+                message is packed, so peak memory grows by up to PARALLEL_ENCODE_MAX_BYTES
+                per dumps() call.  Call close(), or use the codec as a context manager, to
+                shut the pool down.
+            zero_copy_decode: If True, decoders that support it (e.g. numpy arrays) return
+                read-only views instead of writable copies.  The view is over the custom
+                type payload, which msgpack copies out of the message while unpacking
+        """
         self.namespaces = {}
+        self.compact_headers = compact_headers
+        self.zero_copy_decode = zero_copy_decode
+        self._pool = ThreadPoolExecutor(io_workers) if io_workers else None
+        self._pre_encoded = {}
+        # Concrete types cached by _cache_subtype_match, oldest first
+        self._subtype_matches = {}
         self._intern_context = InternContext()
-        self._type_map = {}
-        self._add_default_namespaces()
-        if namespaces:
+        self._used_namespaces = set()
+        self._namespace_ids = {}
+        self._packers = []
+        self._stream_packers = []
+        defaults = self._default_namespaces()
+        if namespaces and not namespaces.keys().isdisjoint(defaults):
+            # Overriding a default namespace, so index everything from scratch
+            self.namespaces.update(defaults)
             self.namespaces.update(namespaces)
-        self._rebuild_type_map()
+            self._reset_type_map()
+            for namespace, types in self.namespaces.items():
+                self._index_namespace(namespace, types)
+            return
+        self._load_default_state(defaults)
+        if namespaces:
+            for namespace, types in namespaces.items():
+                self.namespaces[namespace] = types
+                self._index_namespace(namespace, types)
+
+    def close(self):
+        """Shut down the io_workers pool, if any.  The codec remains usable, encoding serially."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
 
-    def _add_default_namespaces(self):
-        """Add built-in default namespaces to the codec."""
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _default_namespaces() -> Namespaces:
+        """Built-in default namespaces."""
         from .table import table_namespace
-        self.namespaces[table_namespace.name] = table_namespace.custom_types()
+        return {table_namespace.name: table_namespace.custom_types()}
+
+    def _load_default_state(self, defaults: Namespaces):
+        """Start from the default namespaces, sharing lookup tables indexed by an earlier instance."""
+        cached = self._default_states.get(self.compact_headers)
+        if cached is None or cached[0] != defaults:
+            self._reset_type_map()
+            for namespace, types in defaults.items():
+                self._index_namespace(namespace, types)
+            cached = (defaults, {attr: getattr(self, attr) for attr in self._TYPE_MAP_ATTRS})
+            self._default_states[self.compact_headers] = cached
+        else:
+            self.__dict__.update(cached[1])
+        self._type_map_shared = True
+        for namespace, types in cached[0].items():
+            self.namespaces[namespace] = dict(types)
+
+    def _unshare_type_map(self):
+        """Copy lookup tables still shared with the default state, before they are modified."""
+        if self._type_map_shared:
+            self._type_map_shared = False
+            for attr in self._TYPE_MAP_ATTRS:
+                value = getattr(self, attr)
+                setattr(self, attr, value.copy() if isinstance(value, (dict, list)) else value)
 
     def clear_namespaces(self):
         """Remove all namespaces from the codec, including default namespaces."""
         self.namespaces.clear()
-        self._rebuild_type_map()
+        self._reset_type_map()
+        self._subtype_matches.clear()
 
-    def _rebuild_type_map(self):
+    def _reset_type_map(self):
+        self._type_map_shared = False
         self._type_map = {}
-        for namespace, types in self.namespaces.items():
-            if isinstance(types, CustomNameSpace):
-                continue
-            for type_id, codec in types.items():
-                self._type_map[codec.py_type] = (namespace, type_id, codec)
+        self._header_cache = {}
+        self._fast_encoders = {}
+        self._fast_decoders = {}
+        self._subtype_codecs = []
+        self._subtype_types = ()
+        self._custom_namespaces = []
+        self._lazy_codecs = []
+        self._ns_to_id = {}
+        self._namespace_headers = {}
+
+    def _index_namespace(self, namespace: str, types: Namespace):
+        """Add the types of a newly registered namespace to the encode/decode lookup tables."""
+        self._unshare_type_map()
+        ns_id = len(self._ns_to_id)
+        self._ns_to_id[namespace] = ns_id
+        string_namespace_bytes = msgpack.packb(namespace)
+        namespace_bytes = msgpack.packb(ns_id) if self.compact_headers else string_namespace_bytes
+        self._namespace_headers[namespace] = namespace_bytes
+        if isinstance(types, CustomNameSpace):
+            self._custom_namespaces.append((namespace, types, namespace_bytes + msgpack.packb(0)))
+            self._fast_decoders[string_namespace_bytes + msgpack.packb(0)] = types.decode
+            return
+        for type_id, codec in types.items():
+            # Keyed by the full string-namespace header, so decoding a known type skips header parsing
+            self._fast_decoders[string_namespace_bytes + msgpack.packb(type_id)] = codec.decoder
+            if isinstance(codec.py_type, LazyType):
+                self._lazy_codecs.append((namespace, type_id, codec))
+            else:
+                self._index_type(namespace, type_id, codec)
+
+    def _index_type(self, namespace: str, type_id: int, codec: CustomTypeCodec):
+        """Add a custom type to the encode lookup tables."""
+        self._unshare_type_map()
+        self._subtype_matches.pop(codec.py_type, None)
+        self._type_map[codec.py_type] = (namespace, type_id, codec)
+        self._header_cache[codec.py_type] = self._namespace_headers[namespace] + msgpack.packb(type_id)
+        if not self.compact_headers:
+            # Compact headers need to track namespace usage, so go via _encode_custom_type
+            self._fast_encoders[codec.py_type] = (self._header_cache[codec.py_type], codec.encoder)
+        if codec.match_subtypes:
+            self._subtype_codecs.append((codec.py_type, namespace, type_id, codec))
+            self._subtype_types += (codec.py_type,)
+
+    def _cache_subtype_match(self, py_type: type, namespace: str, type_id: int, codec: CustomTypeCodec):
+        """Dispatch later objects of py_type straight to the codec matched via one of its base types.
+
+        Subtype codecs are tried in registration order, so a match can only be displaced by
+        registering py_type itself, which replaces these entries via _index_type.  At most
+        SUBTYPE_MATCH_CACHE_SIZE matches are kept, so dynamically created classes aren't
+        held alive without limit.
+        """
+        self._unshare_type_map()
+        if len(self._subtype_matches) >= SUBTYPE_MATCH_CACHE_SIZE:
+            oldest = next(iter(self._subtype_matches))
+            del self._subtype_matches[oldest]
+            del self._type_map[oldest]
+            self._fast_encoders.pop(oldest, None)
+        self._subtype_matches[py_type] = None
+        self._type_map[py_type] = (namespace, type_id, codec)
+        if not self.compact_headers:
+            self._fast_encoders[py_type] = (self._header_cache[codec.py_type], codec.encoder)
+
+    def _resolve_lazy_types(self) -> bool:
+        """Index any lazily registered types whose modules have since been imported.
+
+        Returns:
+            True if any types were resolved
+        """
+        pending = []
+        for namespace, type_id, codec in self._lazy_codecs:
+            py_type = codec.py_type.resolve()
+            if py_type is None:
+                pending.append((namespace, type_id, codec))
+            else:
+                self._index_type(namespace, type_id, dataclasses.replace(codec, py_type=py_type))
+        resolved = len(pending) < len(self._lazy_codecs)
+        self._lazy_codecs = pending
+        return resolved
 
     def add_namespace(self, namespace: str, types: Namespace):
         if namespace in self.namespaces:
             raise ValueError(f"Namespace '{namespace}' already exists.")
         self.namespaces[namespace] = types
-        self._rebuild_type_map()
+        self._index_namespace(namespace, types)
 
     def add_module(self, module: NamespaceModule):
         if module.name in self.namespaces and self.namespaces[module.name] is not module:
             raise ValueError(f"Namespace '{module.name}' already exists.")
-        self.namespaces[module.name] = module.custom_types()
-        self._rebuild_type_map()
+        types = module.custom_types()
+        self.namespaces[module.name] = types
+        self._index_namespace(module.name, types)
 
     def _encode_custom_type(self, namespace: str, type_id: int, codec: CustomTypeCodec, obj) -> msgpack.ExtType:
-        encoded_data = codec.encoder(self, obj)
-        namespace_bytes = msgpack.packb(namespace)
-        type_id_bytes = msgpack.packb(type_id)
-        payload = namespace_bytes + type_id_bytes + encoded_data
-        return msgpack.ExtType(CUSTOM_TYPE_EXT, payload)
+        if self.compact_headers:
+            self._used_namespaces.add(namespace)
+        header = self._header_cache[codec.py_type]
+        return msgpack.ExtType(CUSTOM_TYPE_EXT, header + codec.encoder(self, obj))
 
     def _default_encoder(self, obj):
+        if self._pre_encoded:
+            pre_encoded = self._pre_encoded.get(id(obj))
+            if pre_encoded is not None:
+                _, namespace, ext = pre_encoded
+                if self.compact_headers:
+                    self._used_namespaces.add(namespace)
+                return ext
+
+        fast = self._fast_encoders.get(type(obj))
+        if fast is not None:
+            header, encoder = fast
+            return msgpack.ExtType(CUSTOM_TYPE_EXT, header + encoder(self, obj))
+
         if isinstance(obj, Intern):
-            encoder = lambda val: msgpack.packb(val, default=self._default_encoder, strict_types=True)
-            return self._intern_context.intern(obj, encoder)
+            return self._intern_context.intern(obj, self._pack)
+
+        hit = self._type_map.get(type(obj))
+        if hit is not None:
+            return self._encode_custom_type(*hit, obj)
+
+        # One C-level isinstance check rules out objects that match no subtype codec
+        if isinstance(obj, self._subtype_types):
+            for py_type, namespace, type_id, codec in self._subtype_codecs:
+                if isinstance(obj, py_type):
+                    self._cache_subtype_match(type(obj), namespace, type_id, codec)
+                    return self._encode_custom_type(namespace, type_id, codec, obj)
+
+        # Lazy types take precedence over custom namespaces, just as registered types do
+        if self._lazy_codecs and self._resolve_lazy_types():
+            return self._default_encoder(obj)
+
+        for namespace, types, header in self._custom_namespaces:
+            if types.matches(obj):
+                if self.compact_headers:
+                    self._used_namespaces.add(namespace)
+                return msgpack.ExtType(CUSTOM_TYPE_EXT, header + types.encode(self, obj))
 
-        py_type = type(obj)
-        if py_type in self._type_map:
-            namespace, type_id, codec = self._type_map[py_type]
-            return self._encode_custom_type(namespace, type_id, codec, obj)
-        
-        for namespace, types in self.namespaces.items():
-            if isinstance(types, CustomNameSpace):
-                if types.matches(obj):
-                    encoded_data = types.encode(self, obj)
-                    namespace_bytes = msgpack.packb(namespace)
-                    type_id_bytes = msgpack.packb(0)
-                    payload = namespace_bytes + type_id_bytes + encoded_data
-                    return msgpack.ExtType(CUSTOM_TYPE_EXT, payload)
         raise TypeError(f"Cannot serialize object of type {type(obj)}")
 
     def _ext_hook(self, code, data):
         if code == INTERN_TABLE_EXT:
-            if self._intern_context.is_active():
-                return self._intern_context.handle_intern_reference(data)
+            intern_context = self._intern_context
+            if intern_context.active:
+                return intern_context.handle_intern_reference(data)
             else:
-                return self._intern_context.decode_intern_table(data, self._ext_hook)
+                return intern_context.decode_intern_table(data, self._ext_hook)
+
+        if code == NAMESPACE_ID_EXT:
+            namespace, ns_id, offset = _read_namespace_header(data)
+            outer_ids = self._namespace_ids
+            self._namespace_ids = {**outer_ids, ns_id: namespace}
+            try:
+                return msgpack.unpackb(memoryview(data)[offset:], ext_hook=self._ext_hook, raw=False)
+            finally:
+                self._namespace_ids = outer_ids
 
         if code == CUSTOM_TYPE_EXT:
-            unpacker = msgpack.Unpacker(raw=False)
-            unpacker.feed(data)
+            offset = _string_header_length(data)
+            if offset is not None:
+                decoder = self._fast_decoders.get(data[:offset])
+                if decoder is not None:
+                    # A view, so splitting off the body doesn't copy it
+                    return decoder(self, memoryview(data)[offset:])
+
+            namespace, type_id, offset = _read_namespace_header(data)
+            remaining_data = memoryview(data)[offset:]
 
-            namespace = next(unpacker)
-            type_id = next(unpacker)
-            remaining_data = data[unpacker.tell():]
+            if type(namespace) is int:
+                if namespace not in self._namespace_ids:
+                    raise ValueError(f"Unknown namespace id: {namespace}")
+                namespace = self._namespace_ids[namespace]
 
             if namespace not in self.namespaces:
                 raise ValueError(f"Unknown namespace: {namespace}")
@@ -211,6 +546,19 @@ class Codec:
 
         return msgpack.ExtType(code, data)
 
+    def _pack(self, obj) -> bytes:
+        """Pack obj with a pooled Packer.
+
+        Packers are not reentrant, and custom type encoders may call dumps() while a
+        pack is in progress, so each nested pack takes its own Packer from the pool.
+        """
+        packers = self._packers
+        packer = packers.pop() if packers else msgpack.Packer(default=self._default_encoder, strict_types=True)
+        try:
+            return packer.pack(obj)
+        finally:
+            packers.append(packer)
+
     def dumps(self, obj) -> bytes:
         """Serialize an object to bytes.
 
@@ -222,12 +570,129 @@ class Codec:
         Returns:
             Serialized bytes
         """
+        if type(obj) in _SCALAR_TYPES:
+            return self._pack(obj)
+
         if self._intern_context.active:
             self._intern_context.end_table()
 
-        data_bytes = msgpack.packb(obj, default=self._default_encoder, strict_types=True)
-
+        if self._pool is not None and not self._pre_encoded:
+            self._pre_encoded = self._pre_encode_large_buffers(obj)
+            try:
+                return self._dumps(obj)
+            finally:
+                self._pre_encoded = {}
+        return self._dumps(obj)
+
+    def _dumps(self, obj) -> bytes:
+        if not self.compact_headers:
+            return self._pack_with_intern_table(obj)
+
+        # Nested dumps() calls (from custom type encoders) produce self-contained messages
+        outer_used = self._used_namespaces
+        self._used_namespaces = set()
+        try:
+            data_bytes = self._pack_with_intern_table(obj)
+            return self._wrap_with_namespace_ids(data_bytes)
+        finally:
+            self._used_namespaces = outer_used
+
+    def _pack_with_intern_table(self, obj) -> bytes:
+        return self._finish_intern_table(self._pack(obj))
+
+    def _finish_intern_table(self, data_bytes: bytes) -> bytes:
+        if self._intern_context.table_is_redundant() and len(data_bytes) <= INLINE_INTERNS_MAX_BYTES:
+            # No interned value is shared, so the table would only add overhead: inline them instead.
+            # Inlining rescans the message in Python, so larger messages keep the (valid) table.
+            data_bytes = self._intern_context.end_table().inline_references(data_bytes)
         return self._intern_context.maybe_wrap_with_table(data_bytes)
 
-    def loads(self, data: bytes):
+    def dumps_into(self, obj, out: bytearray) -> int:
+        """Serialize an object, appending the bytes to out.
+
+        Unless the message needs an intern table or namespace id mappings, the encoded
+        bytes are copied straight from the Packer's buffer without creating a bytes object.
+
+        Args:
+            obj: The object to serialize
+            out: Buffer to append the serialized bytes to
+
+        Returns:
+            The number of bytes written
+        """
+        if self.compact_headers or self._pool is not None:
+            data_bytes = self.dumps(obj)
+            out += data_bytes
+            return len(data_bytes)
+
+        if self._intern_context.active:
+            self._intern_context.end_table()
+
+        packers = self._stream_packers
+        packer = packers.pop() if packers else msgpack.Packer(default=self._default_encoder, strict_types=True, autoreset=False)
+        try:
+            packer.pack(obj)
+            if self._intern_context.active:
+                data_bytes = self._finish_intern_table(packer.bytes())
+                out += data_bytes
+                return len(data_bytes)
+            with packer.getbuffer() as buf:
+                out += buf
+                return len(buf)
+        finally:
+            packer.reset()
+            packers.append(packer)
+
+    def _pre_encode_large_buffers(self, obj) -> dict[int, tuple[object, str, msgpack.ExtType]]:
+        """Encode the large buffer objects within obj's dicts/lists/tuples on the worker pool.
+
+        Returns:
+            dict mapping id(item) to (item, namespace, encoded ExtType)
+        """
+        pending = {}
+        budget = PARALLEL_ENCODE_MAX_BYTES
+        # Containers are walked once each, so shared or self-referencing ones can't loop forever;
+        # packing then reports cycles itself
+        visited = set()
+        stack = [obj]
+        while stack:
+            item = stack.pop()
+            item_type = type(item)
+            if item_type is dict or item_type is list or item_type is tuple or item_type is Intern:
+                if id(item) in visited:
+                    continue
+                visited.add(id(item))
+                if item_type is dict:
+                    stack.extend(item.keys())
+                    stack.extend(item.values())
+                elif item_type is Intern:
+                    stack.append(item.value)
+                else:
+                    stack.extend(item)
+            elif item_type in self._type_map and id(item) not in pending:
+                nbytes = getattr(item, 'nbytes', 0)
+                if PARALLEL_ENCODE_MIN_BYTES <= nbytes <= budget:
+                    budget -= nbytes
+                    namespace, _, codec = self._type_map[item_type]
+                    future = self._pool.submit(self._encode_payload, self._header_cache[codec.py_type], codec, item)
+                    pending[id(item)] = (item, namespace, future)
+
+        return {
+            key: (item, namespace, msgpack.ExtType(CUSTOM_TYPE_EXT, future.result()))
+            for key, (item, namespace, future) in pending.items()
+        }
+
+    def _encode_payload(self, header: bytes, codec: CustomTypeCodec, obj) -> bytes:
+        # bytes.join releases the GIL while copying large buffers, so this runs in parallel on the pool
+        return b''.join((header, codec.encoder(self, obj)))
+
+    def _wrap_with_namespace_ids(self, data_bytes: bytes) -> bytes:
+        """Wrap data in a namespace id mapping for each namespace used while encoding it."""
+        for namespace in self._used_namespaces:
+            payload = msgpack.packb(namespace) + msgpack.packb(self._ns_to_id[namespace]) + data_bytes
+            data_bytes = msgpack.packb(msgpack.ExtType(NAMESPACE_ID_EXT, payload))
+        return data_bytes
+
+    def loads(self, data: bytes | bytearray | memoryview):
+        # Any buffer works, so framed streams can be decoded from memoryview slices without copying
         return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False)
\ No newline at end of file
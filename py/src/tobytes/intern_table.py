@@ -1,9 +1,109 @@
 import msgpack
+import struct
 from typing import Optional, Callable, Any
 
 
 INTERN_TABLE_EXT = 6
 
+_UINT_FORMATS = {
+    0xcc: struct.Struct('>B'),
+    0xcd: struct.Struct('>H'),
+    0xce: struct.Struct('>I'),
+    0xcf: struct.Struct('>Q'),
+}
+
+# msgpack fixarray header with no elements
+_EMPTY_ARRAY = b'\x90'
+
+# References to indices 0-127 (msgpack positive fixints) are prebuilt and shared
+_SMALL_REFS = [msgpack.ExtType(INTERN_TABLE_EXT, bytes([i])) for i in range(128)]
+
+
+def _decode_msgpack_uint(data: bytes) -> Any:
+    """Decode a msgpack message holding a single uint, as used by intern references.
+
+    Falls back to msgpack for anything other than a positive fixint or uint8-64.
+    """
+    if len(data) == 1 and data[0] < 0x80:
+        return data[0]
+    fmt = _UINT_FORMATS.get(data[0]) if data else None
+    if fmt is not None and len(data) == fmt.size + 1:
+        return fmt.unpack_from(data, 1)[0]
+    return msgpack.unpackb(data, raw=False)
+
+
+# Lead bytes of msgpack formats whose length/count is held in a following big-endian uint
+_SIZED_FORMATS = {
+    0xc4: (1, 'bytes'), 0xc5: (2, 'bytes'), 0xc6: (4, 'bytes'),  # bin 8/16/32
+    0xc7: (1, 'ext'), 0xc8: (2, 'ext'), 0xc9: (4, 'ext'),  # ext 8/16/32
+    0xd9: (1, 'bytes'), 0xda: (2, 'bytes'), 0xdb: (4, 'bytes'),  # str 8/16/32
+    0xdc: (2, 'array'), 0xdd: (4, 'array'),
+    0xde: (2, 'map'), 0xdf: (4, 'map'),
+}
+_SIZE_FORMATS = {1: struct.Struct('>B'), 2: struct.Struct('>H'), 4: struct.Struct('>I')}
+
+# Total length of fixed-size scalars, keyed by lead byte
+_FIXED_LENGTHS = {
+    0xc0: 1, 0xc2: 1, 0xc3: 1,  # nil, false, true
+    0xca: 5, 0xcb: 9,  # float 32/64
+    0xcc: 2, 0xcd: 3, 0xce: 5, 0xcf: 9,  # uint 8-64
+    0xd0: 2, 0xd1: 3, 0xd2: 5, 0xd3: 9,  # int 8-64
+}
+
+# fixext 1/2/4/8/16 payload sizes
+_FIXEXT_SIZES = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16}
+
+
+def _reference_spans(data: bytes) -> list[tuple[int, int, int]]:
+    """Find the intern references in a single encoded msgpack object.
+
+    Ext payloads other than references (e.g. custom types) are opaque and are not searched.
+
+    Returns:
+        (start, end, index) for each reference, in order
+    """
+    spans = []
+    pos = 0
+    pending = 1
+    while pending:
+        pending -= 1
+        lead = data[pos]
+        if lead < 0x80 or lead >= 0xe0:  # positive/negative fixint
+            pos += 1
+        elif lead < 0x90:  # fixmap
+            pending += 2 * (lead & 0x0f)
+            pos += 1
+        elif lead < 0xa0:  # fixarray
+            pending += lead & 0x0f
+            pos += 1
+        elif lead < 0xc0:  # fixstr
+            pos += 1 + (lead & 0x1f)
+        elif lead in _FIXED_LENGTHS:
+            pos += _FIXED_LENGTHS[lead]
+        elif lead in _FIXEXT_SIZES:
+            end = pos + 2 + _FIXEXT_SIZES[lead]
+            if data[pos + 1] == INTERN_TABLE_EXT:
+                spans.append((pos, end, _decode_msgpack_uint(data[pos + 2:end])))
+            pos = end
+        elif lead in _SIZED_FORMATS:
+            width, kind = _SIZED_FORMATS[lead]
+            (size,) = _SIZE_FORMATS[width].unpack_from(data, pos + 1)
+            pos += 1 + width
+            if kind == 'bytes':
+                pos += size
+            elif kind == 'ext':
+                end = pos + 1 + size
+                if data[pos] == INTERN_TABLE_EXT:
+                    spans.append((pos - 1 - width, end, _decode_msgpack_uint(data[pos + 1:end])))
+                pos = end
+            elif kind == 'array':
+                pending += size
+            else:
+                pending += 2 * size
+        else:
+            raise ValueError(f"Invalid msgpack format byte 0x{lead:02x}")
+    return spans
+
 
 class Intern:
     """Wrapper to mark a value for interning.
@@ -44,8 +144,13 @@ class InternTable:
 
     def __init__(self):
         self.table = []
-        self.originals = []  # For equality comparison
+        self.hits = []  # Number of references created to each entry
         self.by_id = {}
+        # Interned values are held by by_value/unhashable, which also keeps them alive so
+        # that the id() keys in by_id can't be reused by other objects while the table exists
+        self.by_value = {}
+        self.unhashable = []  # (value, index) pairs that can't be stored in by_value
+        self.identity_only = []
 
     def __len__(self):
         return len(self.table)
@@ -55,17 +160,19 @@ class InternTable:
             raise IndexError(f"Intern table index {index} out of range (table size: {len(self.table)})")
         return self.table[index]
 
-    def get_bytes(self):
+    def get_bytes(self, data_bytes: bytes = b''):
         """Serialize the intern table as a msgpack array.
 
+        Args:
+            data_bytes: Optional encoded data to append after the table
+
         Returns:
             Bytes containing msgpack array header followed by concatenated encoded entries
         """
-        packer = msgpack.Packer()
-        result = packer.pack_array_header(len(self.table))
-        for entry_bytes in self.table:
-            result += entry_bytes
-        return result
+        parts = [msgpack.Packer().pack_array_header(len(self.table))]
+        parts.extend(self.table)
+        parts.append(data_bytes)
+        return b''.join(parts)
 
     def load(self, data: bytes, unpacker_factory: Callable[[bytes], Any]):
         """Load intern table from bytes.
@@ -74,11 +181,23 @@ class InternTable:
             data: Raw bytes containing the msgpack array of interned objects
             unpacker_factory: Function to create unpacker (for handling custom ext types)
         """
+        self.load_from_unpacker(unpacker_factory(data))
+
+    def load_from_unpacker(self, unpacker: msgpack.Unpacker):
+        """Load intern table from the next msgpack array in an unpacker.
+
+        Args:
+            unpacker: Unpacker positioned at the interned_objects array
+        """
         assert len(self.table) == 0, "Cannot load into non-empty intern table"
 
-        unpacker = unpacker_factory(data)
+        try:
+            arr_len = unpacker.read_array_header()
+        except ValueError:
+            raise ValueError("Intern table must start with an array of interned objects") from None
 
-        arr_len = unpacker.read_array_header()
+        # Entries are appended one at a time, so each entry's references can only resolve
+        # to the entries loaded before it
         for _ in range(arr_len):
             entry = unpacker.unpack()
             self.table.append(entry)
@@ -117,10 +236,13 @@ class InternTable:
             key = id(value)
             return self.by_id.get(key)
         else:
-            for idx, original in enumerate(self.originals):
-                if original == value:
-                    return idx
-            return None
+            try:
+                return self.by_value.get(value)
+            except TypeError:
+                for original, idx in self.unhashable:
+                    if original == value:
+                        return idx
+                return None
 
     def intern(self, intern_wrapper: 'Intern', encoder_callback: Callable[[Any], bytes]) -> msgpack.ExtType:
         """Intern a value and return a reference to it.
@@ -137,6 +259,7 @@ class InternTable:
 
         existing_idx = self._find(value, by_identity)
         if existing_idx is not None:
+            self.hits[existing_idx] += 1
             return self.create_reference(existing_idx)
 
         # Encode the value first - this handles nested Interns and ensures topological order
@@ -144,13 +267,46 @@ class InternTable:
 
         idx = len(self.table)
         self.table.append(encoded_bytes)
-        self.originals.append(value)
+        self.hits.append(1)
+        try:
+            stored_idx = self.by_value.setdefault(value, idx)
+        except TypeError:
+            self.unhashable.append((value, idx))
+            stored_idx = idx
 
         if by_identity:
             self.by_id[id(value)] = idx
+            if stored_idx != idx:
+                # An equal value already owns the by_value entry, so keep this one alive for by_id
+                self.identity_only.append(value)
 
         return self.create_reference(idx)
 
+    def inline_references(self, data_bytes: bytes) -> bytes:
+        """Replace the references in encoded data with the encoded entries they point to.
+
+        Used when no entry is shared, so the data can be sent without a table.  Entries are
+        spliced in from their already-encoded bytes, so nothing is encoded again.
+
+        Args:
+            data_bytes: A single encoded msgpack object
+
+        Returns:
+            The encoded object with every reference inlined
+        """
+        spans = _reference_spans(data_bytes)
+        if not spans:
+            return data_bytes
+        parts = []
+        last = 0
+        for start, end, index in spans:
+            parts.append(data_bytes[last:start])
+            # Entries may themselves hold references to earlier entries
+            parts.append(self.inline_references(self.table[index]))
+            last = end
+        parts.append(data_bytes[last:])
+        return b''.join(parts)
+
     def create_reference(self, index: int) -> msgpack.ExtType:
         """Create an intern reference pointing to the given index.
 
@@ -160,6 +316,8 @@ class InternTable:
         Returns:
             msgpack.ExtType representing the reference
         """
+        if 0 <= index < 128:
+            return _SMALL_REFS[index]
         return msgpack.ExtType(INTERN_TABLE_EXT, msgpack.packb(index))
 
 
@@ -215,6 +373,10 @@ class InternContext:
         table = self.ensure_table()
         return table.intern(intern_wrapper, encoder_callback)
 
+    def table_is_redundant(self) -> bool:
+        """Check if the current table has entries, but none of them are referenced more than once."""
+        return self.active and self.table is not None and len(self.table) > 0 and max(self.table.hits) == 1
+
     def maybe_wrap_with_table(self, data_bytes: bytes) -> bytes:
         """Wrap data with intern table if one was created, otherwise return data as-is.
 
@@ -226,7 +388,7 @@ class InternContext:
         """
         try:
             if self.active and self.table and len(self.table) > 0:
-                payload = self.table.get_bytes() + data_bytes
+                payload = self.table.get_bytes(data_bytes)
                 intern_ext = msgpack.ExtType(INTERN_TABLE_EXT, payload)
                 return msgpack.packb(intern_ext)
             else:
@@ -248,11 +410,24 @@ class InternContext:
             ValueError: If there's no active intern table or forward reference detected
             IndexError: If the reference index is out of bounds
         """
-        ref_index = msgpack.unpackb(data, raw=False)
+        table = self.table
+        # Fast path for the common one-byte (positive fixint) reference to a loaded entry
+        if table is not None and len(data) == 1:
+            ref_index = data[0]
+            entries = table.table
+            if ref_index < 0x80 and ref_index < len(entries):
+                return entries[ref_index]
+
+        ref_index = _decode_msgpack_uint(data)
 
-        if self.table is None:
+        if table is None:
             raise ValueError("Intern reference found but no active intern table")
 
+        if type(ref_index) is not int:
+            raise ValueError(f"Intern reference index must be an unsigned integer, got {ref_index!r}")
+        if ref_index < 0:
+            raise IndexError(f"Intern table index {ref_index} out of range (table size: {len(table)})")
+
         # Per spec: references must point to earlier entries (lower indices)
         if ref_index >= len(self.table):
             raise ValueError(
@@ -261,7 +436,7 @@ class InternContext:
                 f"Intern table entries must only reference earlier entries."
             )
 
-        return self.table[ref_index]
+        return self.table.table[ref_index]
 
     def decode_intern_table(self, data: bytes, ext_hook: Callable[[int, bytes], Any]) -> Any:
         """Decode an intern table structure (Ext 6 outside an active intern table).
@@ -273,28 +448,26 @@ class InternContext:
         Returns:
             The decoded data with intern references resolved
         """
-        unpacker = msgpack.Unpacker(raw=False)
-        unpacker.feed(data)
-
-        start_pos = 0
-        _ = unpacker.unpack()
-        end_pos = unpacker.tell()
-
-        interned_objects_bytes = data[start_pos:end_pos]
-        data_bytes = data[end_pos:]
-
         self.start_table()
 
         try:
-            def make_unpacker(unpacker_data: bytes):
-                """Create an unpacker with the ext_hook configured."""
-                up = msgpack.Unpacker(raw=False, ext_hook=ext_hook)
-                up.feed(unpacker_data)
-                return up
-
-            self.table.load(interned_objects_bytes, make_unpacker)
-
-            result = msgpack.unpackb(data_bytes, raw=False, ext_hook=ext_hook)
+            if data[:1] == _EMPTY_ARRAY:
+                # No interned objects, so the data is a plain message.  The (empty) table stays
+                # active so that any reference in it is still reported as invalid.
+                try:
+                    return msgpack.unpackb(memoryview(data)[1:], ext_hook=ext_hook, raw=False)
+                except msgpack.ExtraData:
+                    raise ValueError("Unexpected trailing data in intern table") from None
+
+            # A single unpacker reads the interned objects and then the data, so neither is
+            # decoded twice or copied out of the payload
+            unpacker = msgpack.Unpacker(raw=False, ext_hook=ext_hook, max_buffer_size=len(data))
+            unpacker.feed(data)
+
+            self.table.load_from_unpacker(unpacker)
+            result = unpacker.unpack()
+            if unpacker.tell() != len(data):
+                raise ValueError("Unexpected trailing data in intern table")
 
             return result
         finally:
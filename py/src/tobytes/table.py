@@ -2,10 +2,18 @@
 
 Provides serialization support for tabular types including numpy arrays.
 """
+import ast
+import functools
+import importlib.util
 import io
+import math
+import struct
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    import pandas as pd
+    import polars as pl
+
     from .codec import Codec
 
 try:
@@ -14,68 +22,153 @@ try:
 except ImportError:
     HAS_NUMPY = False
 
-try:
-    import pandas as pd
-    HAS_PANDAS = True
-except ImportError:
-    HAS_PANDAS = False
+# pandas and polars are slow to import, so their types are resolved lazily on first use
+HAS_PANDAS = importlib.util.find_spec('pandas') is not None
+HAS_POLARS = importlib.util.find_spec('polars') is not None
 
-try:
-    import polars as pl
-    HAS_POLARS = True
-except ImportError:
-    HAS_POLARS = False
-
-from .codec import NamespaceModule
+from .codec import LazyType, NamespaceModule
 
 
 table_namespace = NamespaceModule("table")
 
 
 if HAS_NUMPY:
+    _NPY_MAGIC_PREFIX = b'\x93NUMPY'
+    _NPY_HEADER_LENGTH_FORMATS = {
+        1: struct.Struct('<H'),
+        2: struct.Struct('<I'),
+        3: struct.Struct('<I'),
+    }
+
+    _NPY_ALIGN = 64
+
+    @functools.lru_cache(maxsize=256)
+    def _npy_header(dtype: np.dtype, fortran_order: bool, shape: tuple) -> bytes:
+        """Build the .npy preamble (magic, version and header dict) for an array layout.
+
+        Uses the oldest format version that fits, as np.save does: 2.0 for headers
+        over 64KiB, and 3.0 for headers that aren't latin1 (e.g. unicode field names).
+        """
+        # Laid out exactly as np.save writes it
+        header = '{' + ''.join(f'{key!r}: {value!r}, ' for key, value in (
+            ('descr', np.lib.format.dtype_to_descr(dtype)),
+            ('fortran_order', fortran_order),
+            ('shape', shape),
+        )) + '}'
+        for major, encoding in ((1, 'latin1'), (2, 'latin1'), (3, 'utf-8')):
+            try:
+                encoded = header.encode(encoding)
+            except UnicodeEncodeError:
+                continue
+            fmt = _NPY_HEADER_LENGTH_FORMATS[major]
+            preamble_size = len(_NPY_MAGIC_PREFIX) + 2 + fmt.size
+            # Padded with spaces and a newline so the array data is aligned
+            padding = _NPY_ALIGN - (preamble_size + len(encoded) + 1) % _NPY_ALIGN
+            length = len(encoded) + padding + 1
+            if length >= 1 << (8 * fmt.size):
+                continue
+            return b''.join((
+                _NPY_MAGIC_PREFIX, bytes((major, 0)), fmt.pack(length), encoded, b' ' * padding, b'\n'
+            ))
+        raise ValueError("Array header is too large for the .npy format")
+
+    @functools.lru_cache(maxsize=256)
+    def _parse_npy_header(header: bytes, encoding: str) -> tuple[np.dtype, bool, tuple]:
+        """Parse a .npy header dict into (dtype, fortran_order, shape)."""
+        d = ast.literal_eval(header.decode(encoding))
+        if not isinstance(d, dict) or d.keys() != {'descr', 'fortran_order', 'shape'}:
+            raise ValueError(f"Invalid .npy header: {header!r}")
+        shape = d['shape']
+        if not isinstance(shape, tuple) or not all(
+            isinstance(n, int) and not isinstance(n, bool) and n >= 0 for n in shape
+        ):
+            raise ValueError(f"Invalid .npy shape: {shape!r}")
+        return np.lib.format.descr_to_dtype(d['descr']), bool(d['fortran_order']), shape
+
+    def _read_npy_header(data: bytes) -> tuple[np.dtype, bool, tuple, int]:
+        """Read the .npy preamble from the start of data.
+
+        Returns:
+            tuple[np.dtype, bool, tuple, int]: (dtype, fortran_order, shape, offset) where
+                                               offset is the start of the array data
+        """
+        if bytes(data[:len(_NPY_MAGIC_PREFIX)]) != _NPY_MAGIC_PREFIX:
+            raise ValueError("Data is not in .npy format")
+        major = data[len(_NPY_MAGIC_PREFIX)]
+        if major not in _NPY_HEADER_LENGTH_FORMATS:
+            raise ValueError(f"Unsupported .npy format version: {major}")
+        fmt = _NPY_HEADER_LENGTH_FORMATS[major]
+        start = len(_NPY_MAGIC_PREFIX) + 2 + fmt.size
+        end = start + fmt.unpack_from(data, start - fmt.size)[0]
+        encoding = 'utf-8' if major >= 3 else 'latin1'
+        return (*_parse_npy_header(bytes(data[start:end]), encoding), end)
+
     @table_namespace.encoder(py_type=np.ndarray, type_id=1)
     def encode_ndarray(codec: 'Codec', obj: np.ndarray) -> bytes:
         """Encode numpy array using numpy's native format."""
-        buf = io.BytesIO()
-        np.save(buf, obj, allow_pickle=False)
-        return buf.getvalue()
+        if obj.dtype.hasobject:
+            raise ValueError("Object arrays cannot be encoded")
+        fortran_order = obj.flags.f_contiguous and not obj.flags.c_contiguous
+        header = _npy_header(obj.dtype, fortran_order, obj.shape)
+        # Contiguous arrays are joined straight from the array's own memory, with no tobytes()
+        # copy; strided arrays are gathered into a presized buffer.  The codec still copies the
+        # result once more when prefixing the custom type header.
+        if obj.flags.c_contiguous:
+            return b''.join((header, obj.reshape(-1).view(np.uint8).data))
+        if fortran_order:
+            return b''.join((header, obj.T.reshape(-1).view(np.uint8).data))
+        buf = bytearray(len(header) + obj.nbytes)
+        buf[:len(header)] = header
+        np.ndarray(obj.shape, dtype=obj.dtype, buffer=buf, offset=len(header))[...] = obj
+        return buf
 
     @encode_ndarray.decoder
     def decode_ndarray(codec: 'Codec', data: bytes) -> np.ndarray:
-        """Decode numpy array from numpy's native format."""
-        buf = io.BytesIO(data)
-        return np.load(buf, allow_pickle=False)
+        """Decode numpy array from numpy's native format.
+
+        Returns a writable array, unless the codec was created with zero_copy_decode=True,
+        in which case it is a read-only view over the payload bytes (msgpack has already
+        copied these out of the message, so the view saves a second copy, not the first).
+        """
+        dtype, fortran_order, shape, offset = _read_npy_header(data)
+        if dtype.hasobject:
+            raise ValueError("Object arrays cannot be decoded")
+        arr = np.frombuffer(data, dtype=dtype, count=math.prod(shape), offset=offset)
+        arr = arr.reshape(shape, order='F' if fortran_order else 'C')
+        if codec is not None and codec.zero_copy_decode:
+            return arr
+        return arr.copy(order='K')
 
 
 if HAS_PANDAS:
-    @table_namespace.encoder(py_type=pd.DataFrame, type_id=2)
+    @table_namespace.encoder(py_type=LazyType('pandas', 'DataFrame'), type_id=2)
     def encode_pandas_dataframe(codec: 'Codec', obj: 'pd.DataFrame') -> bytes:
         """Encode pandas DataFrame to parquet format."""
         buf = io.BytesIO()
         obj.to_parquet(buf, index=True)
-        return buf.getvalue()
+        return buf.getbuffer()
 
     @encode_pandas_dataframe.decoder
     def decode_pandas_dataframe(codec: 'Codec', data: bytes) -> 'pd.DataFrame':
         """Decode pandas DataFrame from parquet bytes."""
+        import pandas as pd
         buf = io.BytesIO(data)
-        buf.seek(0)
         return pd.read_parquet(buf)
 
 
 if HAS_POLARS:
-    @table_namespace.encoder(py_type=pl.DataFrame, type_id=3)
+    @table_namespace.encoder(py_type=LazyType('polars', 'DataFrame'), type_id=3)
     def encode_polars_dataframe(codec: 'Codec', obj: 'pl.DataFrame') -> bytes:
         """Encode polars DataFrame to parquet format."""
         buf = io.BytesIO()
         obj.write_parquet(buf)
-        return buf.getvalue()
+        return buf.getbuffer()
 
     @encode_polars_dataframe.decoder
     def decode_polars_dataframe(codec: 'Codec', data: bytes) -> 'pl.DataFrame':
         """Decode polars DataFrame from parquet bytes."""
+        import polars as pl
         buf = io.BytesIO(data)
-        buf.seek(0)
         return pl.read_parquet(buf)
 
 
@@ -1,3 +1,5 @@
+import msgpack
+import pytest
 import tobytes
 
 def test_simple():
@@ -52,4 +54,165 @@ def test_custom_namespace():
     serialized = codec.dumps(obj)
     deserialized = codec.loads(serialized)
     assert isinstance(deserialized, AnotherType)
-    assert deserialized.value == 42
\ No newline at end of file
+    assert deserialized.value == 42
+
+def test_custom_wire_format():
+    codec = tobytes.Codec()
+
+    codec.add_namespace("tobytes.test", {
+        3: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: enc.dumps(obj.value),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    serialized = codec.dumps(MyType(1))
+    expected_payload = msgpack.packb("tobytes.test") + msgpack.packb(3) + msgpack.packb(1)
+    assert serialized == msgpack.packb(msgpack.ExtType(8, expected_payload))
+
+
+def test_compact_headers():
+    codec = tobytes.Codec(compact_headers=True)
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: enc.dumps(obj.value),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+    codec.add_namespace("tobytes.test.custom", MyCustomNameSpace())
+
+    data = [MyType(1), MyType(2), AnotherType(3)]
+    serialized = codec.dumps(data)
+    assert serialized.count(b"tobytes.test.custom") == 1
+
+    deserialized = tobytes.Codec(namespaces=codec.namespaces).loads(serialized)
+    assert [type(obj) for obj in deserialized] == [MyType, MyType, AnotherType]
+    assert [obj.value for obj in deserialized] == [1, 2, 3]
+
+
+def test_unknown_namespace_id():
+    codec = tobytes.Codec()
+
+    serialized = msgpack.packb(msgpack.ExtType(8, msgpack.packb(5) + msgpack.packb(1) + msgpack.packb(1)))
+    with pytest.raises(ValueError, match="Unknown namespace id"):
+        codec.loads(serialized)
+
+
+def test_custom_non_canonical_header():
+    codec = tobytes.Codec()
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: enc.dumps(obj.value),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    # str8 namespace and uint16 type_id, rather than the fixstr/fixint an encoder would emit
+    header = b"\xd9\x0ctobytes.test" + b"\xcd\x00\x01"
+    deserialized = codec.loads(msgpack.packb(msgpack.ExtType(8, header + msgpack.packb(5))))
+    assert isinstance(deserialized, MyType)
+    assert deserialized.value == 5
+
+
+def test_custom_encoder_returns_buffer():
+    codec = tobytes.Codec()
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: memoryview(bytearray(enc.dumps(obj.value))),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    deserialized = codec.loads(codec.dumps(MyType([1, 2])))
+    assert deserialized.value == [1, 2]
+
+
+def test_decoded_map_keys_are_shared():
+    codec = tobytes.Codec()
+
+    decoded = codec.loads(codec.dumps([{"name": "Alice", "age": 30}, {"name": "Bob", "age": 25}]))
+    first_keys, second_keys = list(decoded[0]), list(decoded[1])
+    assert all(a is b for a, b in zip(first_keys, second_keys))
+
+
+def test_dumps_into():
+    codec = tobytes.Codec()
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: enc.dumps(obj.value),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    shared = "shared"
+    values = [1, {"a": [1, 2]}, MyType("x"), [tobytes.Intern(shared), tobytes.Intern(shared)]]
+
+    out = bytearray(b"prefix")
+    lengths = [codec.dumps_into(value, out) for value in values]
+
+    assert out[:6] == b"prefix"
+    assert bytes(out[6:]) == b"".join(codec.dumps(value) for value in values)
+    assert lengths == [len(codec.dumps(value)) for value in values]
+
+
+def test_loads_memoryview():
+    codec = tobytes.Codec()
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=lambda enc, obj: enc.dumps(obj.value),
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    shared = "shared"
+    values = [1, {"a": [1, 2]}, MyType("x"), [tobytes.Intern(shared), tobytes.Intern(shared)]]
+
+    out = bytearray()
+    lengths = [codec.dumps_into(value, out) for value in values]
+
+    view = memoryview(out)
+    offset = 0
+    decoded = []
+    for length in lengths:
+        decoded.append(codec.loads(view[offset:offset + length]))
+        offset += length
+
+    assert decoded[:2] == [1, {"a": [1, 2]}]
+    assert isinstance(decoded[2], MyType)
+    assert decoded[2].value == "x"
+    assert decoded[3] == ["shared", "shared"]
+
+
+def test_custom_interned_once():
+    codec = tobytes.Codec()
+    calls = []
+
+    def encode(enc, obj):
+        calls.append(obj.value)
+        return enc.dumps(obj.value)
+
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(
+            py_type=MyType,
+            encoder=encode,
+            decoder=lambda dec, data: MyType(dec.loads(data))
+        )
+    })
+
+    # No value is shared, so no intern table is emitted, and each value is encoded once
+    values = [tobytes.Intern(MyType(i)) for i in range(3)]
+    decoded = codec.loads(codec.dumps({"a": values}))
+
+    assert calls == [0, 1, 2]
+    assert [item.value for item in decoded["a"]] == [0, 1, 2]
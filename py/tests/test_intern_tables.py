@@ -5,11 +5,19 @@ Intern tables allow reducing message size by referencing repeated objects.
 Format: [Ext 6, array interned_objects, any data]
 Intern references: [Ext 6, uint] where uint is the intern ID
 """
+import functools
+
 import msgpack
 import pytest
 import tobytes
 
 
+@functools.lru_cache(maxsize=None)
+def _ref(index):
+    """Build an intern reference to the given index"""
+    return msgpack.ExtType(6, msgpack.packb(index))
+
+
 def test_intern_table_basic_structure():
     """Test basic intern table encoding and decoding"""
     codec = tobytes.Codec()
@@ -21,8 +29,8 @@ def test_intern_table_basic_structure():
 
     interned_objects = ["hello", "world"]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
+    ref_0 = _ref(0)
+    ref_1 = _ref(1)
 
     data = [ref_0, ref_1, ref_0]
 
@@ -42,8 +50,8 @@ def test_intern_table_with_repeated_objects():
     repeated_str = "repeated_value"
     interned_objects = [repeated_str, 123]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
+    ref_0 = _ref(0)
+    ref_1 = _ref(1)
 
     data = {
         "a": ref_0,
@@ -72,8 +80,8 @@ def test_intern_table_with_forward_references():
     # interned_objects[1] = "hello"
     # interned_objects[2] = "world"
 
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
-    ref_2 = msgpack.ExtType(6, msgpack.packb(2))
+    ref_1 = _ref(1)
+    ref_2 = _ref(2)
 
     interned_objects = [
         [ref_1, ref_2],
@@ -81,7 +89,7 @@ def test_intern_table_with_forward_references():
         "world"
     ]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
+    ref_0 = _ref(0)
     data = {"result": ref_0}
 
     payload = msgpack.packb(interned_objects) + msgpack.packb(data)
@@ -102,9 +110,9 @@ def test_intern_table_with_nested_structures():
         ["tag1", "tag2", "tag3"]
     ]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
-    ref_2 = msgpack.ExtType(6, msgpack.packb(2))
+    ref_0 = _ref(0)
+    ref_1 = _ref(1)
+    ref_2 = _ref(2)
 
     data = {
         "users": [ref_0, ref_1, ref_0],
@@ -128,7 +136,7 @@ def test_intern_reference_without_table():
     """Test that intern references without a surrounding table cause an error"""
     codec = tobytes.Codec()
 
-    ref = msgpack.ExtType(6, msgpack.packb(0))
+    ref = _ref(0)
     serialized = msgpack.packb(ref)
 
     with pytest.raises(Exception):
@@ -141,7 +149,7 @@ def test_intern_table_invalid_reference():
 
     interned_objects = ["hello", "world"]
 
-    ref_invalid = msgpack.ExtType(6, msgpack.packb(10))
+    ref_invalid = _ref(10)
     data = ref_invalid
 
     payload = msgpack.packb(interned_objects) + msgpack.packb(data)
@@ -152,6 +160,23 @@ def test_intern_table_invalid_reference():
         codec.loads(serialized)
 
 
+@pytest.mark.parametrize("ref_payload, error", [
+    (b"\xff", IndexError),  # -1
+    (b"\xd0\x80", IndexError),  # -128
+    (b"\xa1a", ValueError),  # "a"
+    (b"\xc3", ValueError),  # True
+])
+def test_intern_table_reference_not_uint(ref_payload, error):
+    """Test that references whose index is not an unsigned integer cause an error"""
+    codec = tobytes.Codec()
+
+    payload = msgpack.packb(["hello", "world"]) + msgpack.packb(msgpack.ExtType(6, ref_payload))
+    serialized = msgpack.packb(msgpack.ExtType(6, payload))
+
+    with pytest.raises(error):
+        codec.loads(serialized)
+
+
 def test_intern_table_no_nested_intern_tables():
     """Test that intern tables cannot be nested within each other"""
     codec = tobytes.Codec()
@@ -160,12 +185,12 @@ def test_intern_table_no_nested_intern_tables():
     # because Ext 6 is repurposed for references within the data section
 
     inner_interned = ["inner"]
-    inner_ref = msgpack.ExtType(6, msgpack.packb(0))
+    inner_ref = _ref(0)
     inner_payload = msgpack.packb(inner_interned) + msgpack.packb(inner_ref)
     inner_table = msgpack.ExtType(6, inner_payload)
 
     outer_interned = [inner_table, "outer"]
-    outer_ref_0 = msgpack.ExtType(6, msgpack.packb(0))
+    outer_ref_0 = _ref(0)
     outer_payload = msgpack.packb(outer_interned) + msgpack.packb(outer_ref_0)
     outer_table = msgpack.ExtType(6, outer_payload)
 
@@ -190,15 +215,26 @@ def test_intern_table_empty():
     assert result == "just a string"
 
 
+def test_intern_table_empty_with_reference():
+    """Test that a reference into an empty intern table causes an error"""
+    codec = tobytes.Codec()
+
+    payload = msgpack.packb([]) + msgpack.packb(["hello", _ref(0)])
+    serialized = msgpack.packb(msgpack.ExtType(6, payload))
+
+    with pytest.raises(ValueError, match="Forward reference detected"):
+        codec.loads(serialized)
+
+
 def test_intern_table_with_none_values():
     """Test intern table with None/null values"""
     codec = tobytes.Codec()
 
     interned_objects = [None, "value", None]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
-    ref_2 = msgpack.ExtType(6, msgpack.packb(2))
+    ref_0 = _ref(0)
+    ref_1 = _ref(1)
+    ref_2 = _ref(2)
 
     data = [ref_0, ref_1, ref_2]
 
@@ -210,6 +246,17 @@ def test_intern_table_with_none_values():
     assert result == [None, "value", None]
 
 
+def test_intern_table_requires_array():
+    """Test that an intern table whose interned_objects is not an array is rejected"""
+    codec = tobytes.Codec()
+
+    payload = msgpack.packb("hello") + msgpack.packb(_ref(0))
+    serialized = msgpack.packb(msgpack.ExtType(6, payload))
+
+    with pytest.raises(ValueError, match="array of interned objects"):
+        codec.loads(serialized)
+
+
 def test_intern_table_chain_references():
     """Test intern table where references point to objects containing other references (backward refs only)"""
     codec = tobytes.Codec()
@@ -219,8 +266,8 @@ def test_intern_table_chain_references():
     # interned_objects[1] = ["second", ref(0)]
     # interned_objects[2] = ["first", ref(1)]
 
-    ref_0 = msgpack.ExtType(6, msgpack.packb(0))
-    ref_1 = msgpack.ExtType(6, msgpack.packb(1))
+    ref_0 = _ref(0)
+    ref_1 = _ref(1)
 
     interned_objects = [
         "final value",
@@ -228,7 +275,7 @@ def test_intern_table_chain_references():
         ["first", ref_1]
     ]
 
-    ref_2 = msgpack.ExtType(6, msgpack.packb(2))
+    ref_2 = _ref(2)
     data = ref_2
 
     payload = msgpack.packb(interned_objects) + msgpack.packb(data)
@@ -278,3 +325,152 @@ def test_serialize_without_intern_table():
     serialized = codec.dumps(data)
     result = codec.loads(serialized)
     assert result == data
+
+
+def test_intern_by_value():
+    """Test that equal values interned with by_identity=False share a single entry"""
+    table = tobytes.InternTable()
+
+    refs = [
+        table.intern(tobytes.Intern("".join(["val", "ue"]), by_identity=False), msgpack.packb),
+        table.intern(tobytes.Intern("".join(["va", "lue"]), by_identity=False), msgpack.packb),
+        table.intern(tobytes.Intern([1, 2], by_identity=False), msgpack.packb),
+        table.intern(tobytes.Intern([1, 2], by_identity=False), msgpack.packb),
+    ]
+
+    assert len(table) == 2
+    assert refs[0] == refs[1]
+    assert refs[2] == refs[3]
+    assert refs[0] != refs[2]
+
+
+def test_intern_by_identity_keeps_values_alive():
+    """Test that identity-interned values stay referenced, so their id() can't be reused"""
+    import weakref
+
+    class Value:
+        def __eq__(self, other):
+            return isinstance(other, Value)
+
+        def __hash__(self):
+            return 0
+
+    table = tobytes.InternTable()
+    first, second = Value(), Value()
+    table.intern(tobytes.Intern(first), lambda val: b"\xc0")
+    table.intern(tobytes.Intern(second), lambda val: b"\xc0")
+    refs = [weakref.ref(first), weakref.ref(second)]
+    del first, second
+
+    assert len(table) == 2
+    assert all(ref() is not None for ref in refs)
+
+
+def test_create_reference_encoding():
+    """Test that intern references encode their index as a msgpack uint"""
+    table = tobytes.InternTable()
+
+    for index in [0, 1, 127, 128, 255, 256, 70000]:
+        assert table.create_reference(index) == msgpack.ExtType(6, msgpack.packb(index))
+
+
+def test_reference_wire_size():
+    """Test that intern references use the smallest ext form for their index"""
+    table = tobytes.InternTable()
+
+    # fixext1 for positive fixints, fixext2 for uint8, ext8 beyond that
+    assert msgpack.packb(table.create_reference(127)) == b"\xd4\x06\x7f"
+    assert msgpack.packb(table.create_reference(128)) == b"\xd5\x06\xcc\x80"
+    assert msgpack.packb(table.create_reference(256)) == b"\xc7\x03\x06\xcd\x01\x00"
+
+
+def test_intern_reference_wide_uint():
+    """Test that references with a wider-than-needed uint payload still decode"""
+    codec = tobytes.Codec()
+
+    interned_objects = ["hello", "world"]
+    data = [
+        msgpack.ExtType(6, b"\xcc\x01"),
+        msgpack.ExtType(6, b"\xcd\x00\x00"),
+        msgpack.ExtType(6, b"\xcf" + (1).to_bytes(8, "big")),
+    ]
+
+    payload = msgpack.packb(interned_objects) + msgpack.packb(data)
+    serialized = msgpack.packb(msgpack.ExtType(6, payload))
+
+    assert codec.loads(serialized) == ["world", "hello", "world"]
+
+
+def test_intern_encodes_each_value_once():
+    """Test that values already in the intern table are not re-encoded"""
+    table = tobytes.InternTable()
+    encoded = []
+
+    def encoder(val):
+        encoded.append(val)
+        return msgpack.packb(val)
+
+    for row in range(10):
+        table.intern(tobytes.Intern(f"name{row % 2}", by_identity=False), encoder)
+        table.intern(tobytes.Intern((row % 3, "x"), by_identity=False), encoder)
+
+    assert len(table) == 5
+    assert len(encoded) == 5
+
+
+def test_serialize_skips_table_without_shared_values():
+    """Test that no intern table is emitted when every interned value is only used once"""
+    codec = tobytes.Codec()
+
+    data = {
+        "a": tobytes.Intern("value1"),
+        "b": [tobytes.Intern("value2"), tobytes.Intern(["nested", tobytes.Intern("value3")])],
+    }
+
+    serialized = codec.dumps(data)
+    assert serialized == msgpack.packb({"a": "value1", "b": ["value2", ["nested", "value3"]]})
+    assert codec.loads(serialized) == {"a": "value1", "b": ["value2", ["nested", "value3"]]}
+
+
+def test_intern_table_entries_decoded_once():
+    """Test that each interned entry is decoded once, even when later entries reference it"""
+    class Point:
+        def __init__(self, x):
+            self.x = x
+
+    decoded = []
+
+    def decode_point(dec, data):
+        decoded.append(data)
+        return Point(dec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_namespace("tobytes.test", {
+        1: tobytes.CustomTypeCodec(py_type=Point, encoder=lambda enc, obj: enc.dumps(obj.x), decoder=decode_point)
+    })
+
+    point = Point(1)
+    pair = [tobytes.Intern(point), "x"]
+    result = codec.loads(codec.dumps([tobytes.Intern(point), tobytes.Intern(pair), tobytes.Intern(pair)]))
+
+    assert len(decoded) == 1
+    assert result[0] is result[1][0]
+    assert result[1] is result[2]
+
+
+def test_serialize_large_message_keeps_unshared_table(monkeypatch):
+    """Test that large messages aren't rescanned to inline unshared interned values"""
+    from tobytes import intern_table
+    from tobytes.codec import INLINE_INTERNS_MAX_BYTES
+
+    def fail(data):
+        raise AssertionError("large message was scanned")
+
+    monkeypatch.setattr(intern_table, "_reference_spans", fail)
+    codec = tobytes.Codec()
+
+    data = {"rows": list(range(INLINE_INTERNS_MAX_BYTES)), "x": tobytes.Intern("a")}
+    serialized = codec.dumps(data)
+
+    assert msgpack.unpackb(serialized).code == 6
+    assert codec.loads(serialized) == {"rows": list(range(INLINE_INTERNS_MAX_BYTES)), "x": "a"}
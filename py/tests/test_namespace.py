@@ -1,3 +1,4 @@
+import sys
 import tobytes
 import pytest
 
@@ -31,4 +32,200 @@ def test_custom_namespace():
     codec.add_module(mod)
 
     encoded = codec.dumps(Bob("Alice"))
-    decoded = codec.loads(encoded)
\ No newline at end of file
+    decoded = codec.loads(encoded)
+
+def test_match_subtypes():
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=Bob, type_id=1, match_subtypes=True)
+    def encode_bob(codec: tobytes.Codec, obj: Bob) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_bob.decoder
+    def decode_bob(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_module(mod)
+
+    decoded = codec.loads(codec.dumps(Bill("Alice")))
+    assert type(decoded) is Bob
+    assert decoded.name == "Alice"
+
+
+def test_exact_type_overrides_matched_subtype():
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=Bob, type_id=1, match_subtypes=True)
+    def encode_bob(codec: tobytes.Codec, obj: Bob) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_bob.decoder
+    def decode_bob(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_module(mod)
+
+    # Encoded twice so the second goes through the dispatch cached for Bill
+    for _ in range(2):
+        assert type(codec.loads(codec.dumps(Bill("Alice")))) is Bob
+
+    codec.add_namespace("test_bill", {
+        1: tobytes.CustomTypeCodec(
+            py_type=Bill,
+            encoder=lambda enc, obj: enc.dumps(obj.name),
+            decoder=lambda dec, data: Bill(dec.loads(data)),
+        )
+    })
+
+    decoded = codec.loads(codec.dumps(Bill("Alice")))
+    assert type(decoded) is Bill
+    assert decoded.name == "Alice"
+
+
+def test_subtype_match_cache_bounded():
+    import gc
+    import weakref
+    from tobytes.codec import SUBTYPE_MATCH_CACHE_SIZE
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=Bob, type_id=1, match_subtypes=True)
+    def encode_bob(codec: tobytes.Codec, obj: Bob) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_bob.decoder
+    def decode_bob(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_module(mod)
+
+    first = type("Dynamic0", (Bob,), {})
+    first_ref = weakref.ref(first)
+    codec.dumps(first("Alice"))
+    del first
+
+    for i in range(1, SUBTYPE_MATCH_CACHE_SIZE + 1):
+        codec.dumps(type(f"Dynamic{i}", (Bob,), {})("Alice"))
+
+    gc.collect()
+    assert first_ref() is None
+    assert codec.loads(codec.dumps(Bill("Alice"))).name == "Alice"
+
+
+def test_registrations_not_shared_between_codecs():
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=Bob, type_id=1)
+    def encode_bob(codec: tobytes.Codec, obj: Bob) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_bob.decoder
+    def decode_bob(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    first = tobytes.Codec()
+    first.add_module(mod)
+    assert first.loads(first.dumps(Bob("Alice"))).name == "Alice"
+
+    second = tobytes.Codec()
+    assert "test_namespace" not in second.namespaces
+    with pytest.raises(TypeError):
+        second.dumps(Bob("Alice"))
+
+    second.clear_namespaces()
+    assert tobytes.Codec().namespaces.keys() == {"table"}
+
+    # Registered codecs are shared, so they can't be changed through one Codec
+    with pytest.raises(AttributeError):
+        first.namespaces["test_namespace"][1].match_subtypes = True
+
+
+def test_duplicate_type_id():
+
+    mod = tobytes.NamespaceModule("test_namespace")
+    mod.encoder(py_type=Bob, type_id=1)(lambda codec, obj: b"")
+
+    with pytest.raises(ValueError):
+        mod.decoder(py_type=Bill, type_id=1)
+
+
+def test_custom_types_updated_by_decorators():
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=Bob, type_id=1)
+    def encode_bob(codec: tobytes.Codec, obj: Bob) -> bytes:
+        return codec.dumps(obj.name)
+
+    assert mod.custom_types()[1].decoder is None
+
+    @encode_bob.decoder
+    def decode_bob(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    assert mod.custom_types()[1].decoder is decode_bob
+
+
+def test_lazy_type(monkeypatch):
+    import types
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=tobytes.LazyType("tobytes_test_lazy", "Lazy"), type_id=1)
+    def encode_lazy(codec: tobytes.Codec, obj) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_lazy.decoder
+    def decode_lazy(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_module(mod)
+
+    lazy_module = types.ModuleType("tobytes_test_lazy")
+    lazy_module.Lazy = type("Lazy", (Bob,), {})
+    monkeypatch.setitem(sys.modules, "tobytes_test_lazy", lazy_module)
+
+    decoded = codec.loads(codec.dumps(lazy_module.Lazy("Alice")))
+    assert decoded.name == "Alice"
+
+
+def test_lazy_type_precedes_custom_namespace(monkeypatch):
+    import types
+
+    class AnyBob(tobytes.CustomNameSpace):
+        def matches(self, obj: object) -> bool:
+            return isinstance(obj, Bob)
+
+        def encode(self, codec: tobytes.Codec, obj: object) -> bytes:
+            return codec.dumps("custom")
+
+        def decode(self, codec: tobytes.Codec, data: bytes) -> object:
+            return Bob(codec.loads(data))
+
+    mod = tobytes.NamespaceModule("test_namespace")
+
+    @mod.encoder(py_type=tobytes.LazyType("tobytes_test_lazy", "Lazy"), type_id=1)
+    def encode_lazy(codec: tobytes.Codec, obj) -> bytes:
+        return codec.dumps(obj.name)
+
+    @encode_lazy.decoder
+    def decode_lazy(codec: tobytes.Codec, data: bytes) -> Bob:
+        return Bob(codec.loads(data))
+
+    codec = tobytes.Codec()
+    codec.add_module(mod)
+    codec.add_namespace("tobytes.test.any_bob", AnyBob())
+
+    lazy_module = types.ModuleType("tobytes_test_lazy")
+    lazy_module.Lazy = type("Lazy", (Bob,), {})
+    monkeypatch.setitem(sys.modules, "tobytes_test_lazy", lazy_module)
+
+    assert codec.loads(codec.dumps(lazy_module.Lazy("Alice"))).name == "Alice"
+    assert codec.loads(codec.dumps(Bob("Alice"))).name == "custom"
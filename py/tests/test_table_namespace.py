@@ -1,3 +1,4 @@
+import msgpack
 import tobytes
 import pytest
 
@@ -112,6 +113,15 @@ def test_table_namespace_readdable_after_clear():
     assert np.array_equal(decoded, arr)
 
 
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_interned_once():
+    """Test that a numpy array interned only once is inlined and still encoded"""
+    codec = tobytes.Codec()
+
+    decoded = codec.loads(codec.dumps({"a": tobytes.Intern(np.arange(3))}))
+    assert np.array_equal(decoded["a"], np.arange(3))
+
+
 @pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
 def test_numpy_array_in_complex_structure():
     """Test that numpy arrays work within complex nested structures."""
@@ -170,3 +180,148 @@ def test_polars_dataframe_round_trip():
 
     assert isinstance(decoded, pl.DataFrame)
     assert decoded.frame_equal(df)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_npy_compatible():
+    """Test that encoded arrays are byte-compatible with numpy's .npy format."""
+    import io
+    from tobytes.table import encode_ndarray, decode_ndarray
+
+    arrays = [
+        np.arange(6).reshape(2, 3),
+        np.arange(6).reshape(2, 3).T,
+        np.arange(24).reshape(2, 3, 4)[:, ::2],
+        np.array(5.0),
+        np.arange(4, dtype=">i4"),
+    ]
+
+    for arr in arrays:
+        buf = io.BytesIO()
+        np.save(buf, arr, allow_pickle=False)
+        encoded = encode_ndarray(None, arr)
+        assert encoded == buf.getvalue()
+
+        decoded = decode_ndarray(None, encoded)
+        assert decoded.dtype == arr.dtype
+        assert np.array_equal(decoded, arr)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+@pytest.mark.filterwarnings("ignore:Stored array in format")
+def test_numpy_array_npy_later_versions():
+    """Test that headers needing .npy format 2.0 or 3.0 are written as np.save writes them."""
+    import io
+    from tobytes.table import encode_ndarray
+
+    arrays = {
+        2: np.zeros(2, dtype=[(f'field{i}', 'i4') for i in range(4000)]),
+        3: np.array([(1,), (2,)], dtype=[('\u5b57', 'i4')]),
+    }
+
+    for version, arr in arrays.items():
+        buf = io.BytesIO()
+        np.save(buf, arr, allow_pickle=False)
+        encoded = encode_ndarray(None, arr)
+        assert encoded[6] == version
+        assert encoded == buf.getvalue()
+
+        codec = tobytes.Codec()
+        decoded = codec.loads(codec.dumps(arr))
+        assert decoded.dtype == arr.dtype
+        assert np.array_equal(decoded, arr)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_invalid_shape():
+    """Test that a .npy header with a malformed shape is rejected."""
+    from tobytes.table import decode_ndarray
+
+    for shape in ['(-1,)', '(True,)', '[2]', '(2.0,)']:
+        header = f"{{'descr': '<i4', 'fortran_order': False, 'shape': {shape}, }}".encode('latin1')
+        header += b' ' * (63 - (10 + len(header)) % 64) + b'\n'
+        data = b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header + bytes(8)
+        with pytest.raises(ValueError):
+            decode_ndarray(None, data)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_decode_is_view():
+    """Test that with zero_copy_decode, decoded arrays share memory with the payload."""
+    arr = np.arange(12, dtype=np.float64).reshape(3, 4).T
+    codec = tobytes.Codec(zero_copy_decode=True)
+    decoded = codec.loads(codec.dumps(arr))
+
+    assert not decoded.flags.owndata
+    assert not decoded.flags.writeable
+    assert decoded.flags.f_contiguous
+    assert np.array_equal(decoded, arr)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_decode_views_payload():
+    """Test that with zero_copy_decode, decoded arrays view the custom type payload itself."""
+    arr = np.arange(12, dtype=np.int32)
+    codec = tobytes.Codec(zero_copy_decode=True)
+    payload = codec.dumps(arr)
+    ext = msgpack.unpackb(payload, ext_hook=lambda code, data: data)
+    decoded = codec._ext_hook(tobytes.codec.CUSTOM_TYPE_EXT, ext)
+
+    assert np.shares_memory(decoded, np.frombuffer(ext, dtype=np.uint8))
+    assert np.array_equal(decoded, arr)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_array_decode_is_writable():
+    """Test that decoded arrays are writable by default."""
+    arr = np.arange(12, dtype=np.float64).reshape(3, 4).T
+    codec = tobytes.Codec()
+    decoded = codec.loads(codec.dumps(arr))
+
+    assert decoded.flags.writeable
+    assert decoded.flags.f_contiguous
+    decoded[0, 0] = -1
+    assert decoded[0, 0] == -1
+    assert np.array_equal(decoded[1:], arr[1:])
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_numpy_parallel_encode():
+    """Test that encoding large arrays on worker threads matches serial encoding."""
+    from tobytes.codec import PARALLEL_ENCODE_MIN_BYTES
+
+    large = np.arange(PARALLEL_ENCODE_MIN_BYTES // 8 + 1, dtype=np.float64)
+    data = {
+        "arrays": [large, large[::-1].copy(), np.array([1, 2, 3])],
+        "same": large,
+    }
+
+    encoded = tobytes.Codec(io_workers=2).dumps(data)
+    assert encoded == tobytes.Codec().dumps(data)
+
+    decoded = tobytes.Codec().loads(encoded)
+    assert np.array_equal(decoded["arrays"][1], data["arrays"][1])
+    assert np.array_equal(decoded["same"], large)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_parallel_encode_self_referencing():
+    """Test that a self-referencing list fails like serial encoding instead of hanging."""
+    data = [np.arange(3)]
+    data.append(data)
+
+    with tobytes.Codec(io_workers=2) as codec:
+        with pytest.raises(ValueError):
+            codec.dumps(data)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="numpy not installed")
+def test_parallel_encode_close():
+    """Test that a closed codec shuts its pool down and keeps encoding serially."""
+    codec = tobytes.Codec(io_workers=2)
+    pool = codec._pool
+    codec.close()
+
+    with pytest.raises(RuntimeError):
+        pool.submit(int)
+    assert np.array_equal(codec.loads(codec.dumps([np.arange(3)]))[0], np.arange(3))
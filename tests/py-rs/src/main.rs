@@ -4,6 +4,14 @@ use serde::{Deserialize, Serialize};
 // Include the generated code from build.rs
 include!(concat!(env!("OUT_DIR"), "/generated.rs"));
 
+// Request opcodes for serve mode
+const OP_DECODE: u8 = 0;
+const OP_ENCODE: u8 = 1;
+
+// Response status codes for serve mode
+const STATUS_OK: u8 = 0;
+const STATUS_ERROR: u8 = 1;
+
 #[derive(Debug, Deserialize, Serialize)]
 struct TestCase {
     name: String,
@@ -12,65 +20,134 @@ struct TestCase {
     tests: Vec<serde_json::Value>,
 }
 
+fn load_test_case(yaml_file: &str) -> std::result::Result<(TestCase, RustType), Box<dyn std::error::Error>> {
+    // Read YAML test case
+    let yaml_content = std::fs::read_to_string(yaml_file)?;
+    let test_case: TestCase = serde_yaml::from_str(&yaml_content)?;
+
+    // Parse the name into the RustType enum
+    let rust_type = RustType::from_name(&test_case.name)?;
+    Ok((test_case, rust_type))
+}
+
+/// Encode every test value, producing: [4-byte length][encoded bytes]...
+fn encode_case(test_case: &TestCase, rust_type: RustType) -> std::result::Result<Vec<u8>, Box<dyn std::error::Error>> {
+    let mut output = Vec::new();
+    for test_value in &test_case.tests {
+        let encoded = encode_value(rust_type, test_value)?;
+        // Write length as 4-byte big-endian integer
+        output.extend_from_slice(&(encoded.len() as u32).to_be_bytes());
+        // Write the encoded bytes
+        output.extend_from_slice(&encoded);
+    }
+    Ok(output)
+}
+
+/// Decode encoded byte chunks: [4-byte length][encoded bytes]... into a JSON array
+fn decode_case(rust_type: RustType, input: &[u8]) -> std::result::Result<Vec<u8>, Box<dyn std::error::Error>> {
+    let mut results = Vec::new();
+    let mut cursor = io::Cursor::new(input);
+    while cursor.position() < input.len() as u64 {
+        // Read 4-byte length
+        let mut len_bytes = [0u8; 4];
+        if cursor.read_exact(&mut len_bytes).is_err() {
+            break;
+        }
+        let len = u32::from_be_bytes(len_bytes) as usize;
+
+        // Read encoded bytes
+        let mut bytes = vec![0u8; len];
+        cursor.read_exact(&mut bytes)?;
+
+        // Decode
+        let decoded = decode_value(rust_type, &bytes)?;
+        results.push(decoded);
+    }
+
+    Ok(serde_json::to_vec(&results)?)
+}
+
+fn handle_request(op: u8, case_file: &str, payload: &[u8]) -> std::result::Result<Vec<u8>, Box<dyn std::error::Error>> {
+    let (test_case, rust_type) = load_test_case(case_file)?;
+    match op {
+        OP_DECODE => decode_case(rust_type, payload),
+        OP_ENCODE => encode_case(&test_case, rust_type),
+        _ => Err(format!("Invalid op: {}", op).into()),
+    }
+}
+
+/// Serve requests until stdin is closed.
+///
+/// Request:  [u8 op][u32 case_file_len][u32 payload_len][case_file][payload]
+/// Response: [u8 status][u32 body_len][body]
+///
+/// All integers are big-endian.  On error, the body is a UTF-8 message.
+fn serve() -> std::result::Result<(), Box<dyn std::error::Error>> {
+    let stdin = io::stdin();
+    let stdout = io::stdout();
+    let mut input = stdin.lock();
+    let mut output = stdout.lock();
+
+    loop {
+        let mut header = [0u8; 9];
+        match input.read_exact(&mut header) {
+            Ok(()) => {}
+            Err(e) if e.kind() == io::ErrorKind::UnexpectedEof => return Ok(()),
+            Err(e) => return Err(e.into()),
+        }
+        let op = header[0];
+        let case_len = u32::from_be_bytes(header[1..5].try_into()?) as usize;
+        let payload_len = u32::from_be_bytes(header[5..9].try_into()?) as usize;
+
+        let mut case_bytes = vec![0u8; case_len];
+        input.read_exact(&mut case_bytes)?;
+        let mut payload = vec![0u8; payload_len];
+        input.read_exact(&mut payload)?;
+
+        let case_file = String::from_utf8(case_bytes)?;
+        let (status, body) = match handle_request(op, &case_file, &payload) {
+            Ok(body) => (STATUS_OK, body),
+            Err(e) => (STATUS_ERROR, e.to_string().into_bytes()),
+        };
+
+        output.write_all(&[status])?;
+        output.write_all(&(body.len() as u32).to_be_bytes())?;
+        output.write_all(&body)?;
+        output.flush()?;
+    }
+}
+
 fn main() -> std::result::Result<(), Box<dyn std::error::Error>> {
     let args: Vec<String> = std::env::args().collect();
 
+    if args.len() == 2 && args[1] == "serve" {
+        return serve();
+    }
+
     if args.len() != 3 {
         eprintln!("Usage: test_harness <encode|decode> <yaml_file>");
+        eprintln!("       test_harness serve");
         std::process::exit(1);
     }
 
     let mode = &args[1];
-    let yaml_file = &args[2];
-
-    // Read YAML test case
-    let yaml_content = std::fs::read_to_string(yaml_file)?;
-    let test_case: TestCase = serde_yaml::from_str(&yaml_content)?;
-
-    // Parse the name into the RustType enum
-    let rust_type = RustType::from_name(&test_case.name)?;
+    let (test_case, rust_type) = load_test_case(&args[2])?;
 
     match mode.as_str() {
         "encode" => {
-            // For each test value, encode it and write: [4-byte length][encoded bytes]
-            for test_value in &test_case.tests {
-                let encoded = encode_value(rust_type, test_value)?;
-                // Write length as 4-byte big-endian integer
-                let len = encoded.len() as u32;
-                io::stdout().write_all(&len.to_be_bytes())?;
-                // Write the encoded bytes
-                io::stdout().write_all(&encoded)?;
-            }
+            let output = encode_case(&test_case, rust_type)?;
+            io::stdout().write_all(&output)?;
         }
         "decode" => {
             // Read encoded byte chunks from stdin: [4-byte length][encoded bytes]...
-            let mut results = Vec::new();
             let mut input = Vec::new();
             io::stdin().read_to_end(&mut input)?;
 
-            let mut cursor = io::Cursor::new(&input);
-            while cursor.position() < input.len() as u64 {
-                // Read 4-byte length
-                let mut len_bytes = [0u8; 4];
-                if cursor.read_exact(&mut len_bytes).is_err() {
-                    break;
-                }
-                let len = u32::from_be_bytes(len_bytes) as usize;
-
-                // Read encoded bytes
-                let mut bytes = vec![0u8; len];
-                cursor.read_exact(&mut bytes)?;
-
-                // Decode
-                let decoded = decode_value(rust_type, &bytes)?;
-                results.push(decoded);
-            }
-
-            let output = serde_json::to_string(&results)?;
-            io::stdout().write_all(output.as_bytes())?;
+            let output = decode_case(rust_type, &input)?;
+            io::stdout().write_all(&output)?;
         }
         _ => {
-            eprintln!("Invalid mode: {}. Use 'encode' or 'decode'", mode);
+            eprintln!("Invalid mode: {}. Use 'encode', 'decode' or 'serve'", mode);
             std::process::exit(1);
         }
     }
@@ -14,9 +14,14 @@
 # ///
 """Cross-language test harness for Python and Rust tobytes implementations."""
 
+import concurrent.futures as cf
+import hashlib
 import json
+import os
+import struct
 import subprocess
 import sys
+import threading
 from pathlib import Path
 
 import click
@@ -25,6 +30,11 @@ import polars as pl
 import tobytes
 import yaml
 
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 
 def build_rust_binary():
     """Build the Rust test harness binary."""
@@ -51,7 +61,123 @@ def build_rust_binary():
     return bin_path
 
 
-def test_py_encode_rs_decode(test_values: list, case_file: Path, rust_binary: Path, verbose: bool = False, py_prepare: str = None):
+# Opcodes and framing for the Rust harness `serve` mode (see src/main.rs)
+OP_DECODE = 0
+OP_ENCODE = 1
+STATUS_OK = 0
+REQUEST_HEADER = struct.Struct('>BII')
+RESPONSE_HEADER = struct.Struct('>BI')
+LENGTH_PREFIX = struct.Struct('>I')
+
+
+class HarnessProtocolError(Exception):
+    """The persistent Rust harness stopped responding with valid frames."""
+
+
+class HarnessClient:
+    """Talk to a single long-lived Rust harness process for the whole run.
+
+    If the persistent process fails at the protocol level (it exits, or a
+    frame is truncated), the client falls back to spawning the harness once
+    per request, as `encode`/`decode` modes did before.
+    """
+
+    def __init__(self, rust_binary: Path):
+        self.rust_binary = rust_binary
+        self.proc = None
+        try:
+            self.proc = subprocess.Popen(
+                [str(rust_binary), "serve"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                bufsize=0,
+            )
+        except OSError:
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+    def decode(self, case_file: Path, payload) -> bytes:
+        return self._request(OP_DECODE, "decode", case_file, payload)
+
+    def encode(self, case_file: Path) -> bytes:
+        return self._request(OP_ENCODE, "encode", case_file, b'')
+
+    def _request(self, op: int, mode: str, case_file: Path, payload) -> bytes:
+        if self.proc is not None:
+            try:
+                status, body = self._roundtrip(op, case_file, payload)
+            except (HarnessProtocolError, OSError):
+                self.close()
+            else:
+                if status != STATUS_OK:
+                    raise RuntimeError(f"Rust {mode} failed: {body.decode('utf-8', errors='replace')}")
+                return body
+        return self._run_once(mode, case_file, payload)
+
+    def _roundtrip(self, op: int, case_file: Path, payload):
+        case_bytes = str(case_file).encode('utf-8')
+        # The payload is written straight from the caller's buffer; only the small header is copied
+        self._write_all(REQUEST_HEADER.pack(op, len(case_bytes), len(payload)) + case_bytes)
+        self._write_all(payload)
+        status, length = RESPONSE_HEADER.unpack(self._read_exact(RESPONSE_HEADER.size))
+        return status, self._read_exact(length)
+
+    def _write_all(self, data) -> None:
+        # stdin is unbuffered, so a single write() may accept only part of the data
+        view = memoryview(data).cast('B')
+        written = 0
+        while written < len(view):
+            n = self.proc.stdin.write(view[written:])
+            if n == 0:
+                raise HarnessProtocolError("Rust harness stopped reading its input mid-frame")
+            written += n or 0
+
+    def _read_exact(self, size: int) -> bytes:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        read = 0
+        while read < size:
+            n = self.proc.stdout.readinto(view[read:])
+            if not n:
+                raise HarnessProtocolError("Rust harness closed its output mid-frame")
+            read += n
+        return bytes(buf)
+
+    def _run_once(self, mode: str, case_file: Path, payload) -> bytes:
+        result = subprocess.run(
+            [str(self.rust_binary), mode, str(case_file)],
+            input=payload,
+            capture_output=True
+        )
+
+        if result.returncode != 0:
+            error_msg = result.stderr.decode('utf-8', errors='replace') if result.stderr else result.stdout.decode('utf-8', errors='replace')
+            raise RuntimeError(f"Rust {mode} failed: {error_msg}")
+
+        return result.stdout
+
+
+def test_py_encode_rs_decode(test_values: list, case_file: Path, harness: 'HarnessClient', verbose: bool = False, prepare_code=None):
     """Test: Python encodes -> Rust decodes."""
     codec = tobytes.Codec()
 
@@ -59,65 +185,44 @@ def test_py_encode_rs_decode(test_values: list, case_file: Path, rust_binary: Pa
     encoded_data = bytearray()
     for value in test_values:
         # Apply py_prepare transformation if specified
-        if py_prepare:
-            namespace = {'value': value}
-            exec(f'value = {py_prepare}', globals(), namespace)
-            value = namespace['value']
+        if prepare_code is not None:
+            value = eval(prepare_code, globals(), {'value': value})
 
-        encoded = codec.dumps(value)
-        # Write 4-byte length prefix (big-endian)
-        encoded_data.extend(len(encoded).to_bytes(4, 'big'))
-        # Write encoded bytes
-        encoded_data.extend(encoded)
+        # Reserve a 4-byte length prefix (big-endian), backfilled once the value is encoded
+        offset = len(encoded_data)
+        encoded_data.extend(b'\x00\x00\x00\x00')
+        length = codec.dumps_into(value, encoded_data)
+        struct.pack_into('>I', encoded_data, offset, length)
 
     # Rust: decode the byte stream
-    result = subprocess.run(
-        [str(rust_binary), "decode", str(case_file)],
-        input=bytes(encoded_data),
-        capture_output=True
-    )
-
-    if result.returncode != 0:
-        error_msg = result.stderr.decode('utf-8', errors='replace') if result.stderr else result.stdout.decode('utf-8', errors='replace')
-        raise RuntimeError(f"Rust decode failed: {error_msg}")
-
-    decoded_json = json.loads(result.stdout.decode('utf-8'))
+    decoded_json = json.loads(harness.decode(case_file, encoded_data).decode('utf-8'))
     return decoded_json
 
 
-def test_rs_encode_py_decode(test_values: list, case_file: Path, rust_binary: Path, verbose: bool = False):
+def test_rs_encode_py_decode(test_values: list, case_file: Path, harness: 'HarnessClient', verbose: bool = False):
     """Test: Rust encodes -> Python decodes."""
     # Rust: encode test values to byte stream
-    result = subprocess.run(
-        [str(rust_binary), "encode", str(case_file)],
-        capture_output=True
-    )
-
-    if result.returncode != 0:
-        error_msg = result.stderr.decode('utf-8', errors='replace') if result.stderr else result.stdout.decode('utf-8', errors='replace')
-        raise RuntimeError(f"Rust encode failed: {error_msg}")
+    data = harness.encode(case_file)
 
     # Python: decode each byte chunk from the stream
     codec = tobytes.Codec()
     decoded_values = []
 
-    data = result.stdout
+    # Decode straight from views into the stream rather than slicing out copies
+    view = memoryview(data)
+    size = len(data)
     offset = 0
-    while offset < len(data):
+    while offset + 4 <= size:
         # Read 4-byte length prefix (big-endian)
-        if offset + 4 > len(data):
-            break
-        length = int.from_bytes(data[offset:offset+4], 'big')
+        (length,) = LENGTH_PREFIX.unpack_from(view, offset)
         offset += 4
 
         # Read encoded bytes
-        if offset + length > len(data):
+        if offset + length > size:
             break
-        encoded_bytes = data[offset:offset+length]
+        decoded = codec.loads(view[offset:offset+length])
         offset += length
 
-        # Decode
-        decoded = codec.loads(encoded_bytes)
         decoded_values.append(decoded)
 
     return decoded_values
@@ -130,111 +235,186 @@ def normalize_value(value):
     return value
 
 
-def compare_values(original, decoded, path="", py_compare="expected == actual"):
-    """Compare original and decoded values, handling type conversions."""
-    namespace = {'expected': original, 'actual': decoded}
+DEFAULT_PY_COMPARE = 'expected == actual'
+
+
+def compile_expression(source: str, name: str):
+    """Compile a case expression once so it can be evaluated per value without re-parsing."""
+    return compile(source, f'<{name}>', 'eval')
+
+
+def compare_values(original, decoded, path="", compare_code=None, out=print):
+    """Compare original and decoded values, handling type conversions.
+
+    `compare_code` is a compiled `py_compare` expression; None means the
+    default `expected == actual`, which is evaluated directly.  Mismatches
+    are reported through `out`.
+    """
     try:
-        result = eval(py_compare, globals(), namespace)
+        if compare_code is None:
+            result = original == decoded
+        else:
+            result = eval(compare_code, globals(), {'expected': original, 'actual': decoded})
         if not result:
-            print(f"Comparison failed at {path}: expected={original}, actual={decoded}")
+            out(f"Comparison failed at {path}: expected={original}, actual={decoded}")
         return result
     except Exception as e:
-        print(f"Comparison error at {path}: {e}")
+        out(f"Comparison error at {path}: {e}")
         return False
 
 
-def run_test_case(case_file: Path, rust_binary: Path, verbose: bool = False):
-    """Run both directions of testing for a single test case."""
+def json_case_path(case_file: Path) -> Path:
+    """Path of the JSON copy written alongside a YAML case by --jsonify-cases."""
+    return case_file.with_suffix('.json')
+
+
+def json_safe(value) -> bool:
+    """Check that a loaded YAML value survives a JSON round trip unchanged."""
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and json_safe(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(json_safe(v) for v in value)
+    return value is None or isinstance(value, (str, int, float))
+
+
+def load_test_case(case_file: Path) -> dict:
+    """Load a case, preferring a JSON copy written from the same YAML source over parsing it."""
+    source = case_file.read_bytes()
+    try:
+        with open(json_case_path(case_file)) as f:
+            cached = json.load(f)
+        if cached['source_sha256'] == hashlib.sha256(source).hexdigest():
+            return cached['case']
+    except (OSError, ValueError, KeyError, TypeError):
+        # A missing, truncated or otherwise unusable copy just means parsing the YAML
+        pass
+
+    return yaml.load(source, Loader=YamlLoader)
+
+
+def write_json_cases(test_cases: list):
+    """Write a JSON copy of each YAML case so later runs can skip YAML parsing.
+
+    Each copy records a hash of its YAML source, and is only used while that source is
+    unchanged.  Cases that JSON can't represent exactly (e.g. non-string map keys) are
+    not copied.
+    """
+    written = 0
+    for case_file in test_cases:
+        source = case_file.read_bytes()
+        test_case = yaml.load(source, Loader=YamlLoader)
+        json_file = json_case_path(case_file)
+        if not json_safe(test_case):
+            print(f"Not caching {case_file.name}: it holds values JSON can't round trip (e.g. non-string keys)")
+            json_file.unlink(missing_ok=True)
+            continue
+        with open(json_file, 'w') as f:
+            json.dump({'source_sha256': hashlib.sha256(source).hexdigest(), 'case': test_case}, f)
+        written += 1
+    print(f"Wrote JSON copies of {written} of {len(test_cases)} test case(s)")
+
+
+def run_test_case(case_file: Path, harness: 'HarnessClient', verbose: bool = False):
+    """Run both directions of testing for a single test case.
+
+    Cases run on worker threads, so output is collected rather than printed.
+
+    Returns:
+        tuple[bool, list[str]]: whether the case passed, and its output lines
+    """
     case_name = case_file.name
     results = []
+    lines = []
+    out = lines.append
 
-    with open(case_file) as f:
-        test_case = yaml.safe_load(f)
+    test_case = load_test_case(case_file)
 
     test_values = test_case['tests']
     description = test_case.get('description', '')
     py_prepare = test_case.get('py_prepare')
-    py_compare = test_case.get('py_compare', 'expected == actual')
+    py_compare = test_case.get('py_compare', DEFAULT_PY_COMPARE)
+    prepare_code = compile_expression(py_prepare, 'py_prepare') if py_prepare else None
+    compare_code = compile_expression(py_compare, 'py_compare') if py_compare != DEFAULT_PY_COMPARE else None
     if verbose:
-        print(f"\n{click.style('Testing', bold=True)} {case_name}: {description}")
-        print(f"  Rust type: {test_case['rust_type']}")
-        print(f"  Test values: {test_values}")
+        out(f"\n{click.style('Testing', bold=True)} {case_name}: {description}")
+        out(f"  Rust type: {test_case['rust_type']}")
+        out(f"  Test values: {test_values}")
         if py_prepare:
-            print(f"  py_prepare: {py_prepare}")
-        if py_compare != 'expected == actual':
-            print(f"  py_compare: {py_compare}")
+            out(f"  py_prepare: {py_prepare}")
+        if py_compare != DEFAULT_PY_COMPARE:
+            out(f"  py_compare: {py_compare}")
 
     # Test 1: Python encode -> Rust decode
     try:
-        decoded_from_rust = test_py_encode_rs_decode(test_values, case_file, rust_binary, verbose, py_prepare)
+        decoded_from_rust = test_py_encode_rs_decode(test_values, case_file, harness, verbose, prepare_code)
         if verbose:
-            print(f"  Py->Rs decoded: {decoded_from_rust}")
+            out(f"  Py->Rs decoded: {decoded_from_rust}")
 
         # Compare each value (compare original test values with decoded)
         all_match = True
         for i, (original, decoded) in enumerate(zip(test_values, decoded_from_rust)):
-            if not compare_values(original, decoded, f"test[{i}]", py_compare):
+            if not compare_values(original, decoded, f"test[{i}]", compare_code, out):
                 all_match = False
                 break
 
         if not all_match:
             if verbose:
-                print(f"  {click.style('✗', fg='red', bold=True)} Python encode -> Rust decode: FAILED")
+                out(f"  {click.style('✗', fg='red', bold=True)} Python encode -> Rust decode: FAILED")
             else:
-                print(f"{click.style(case_name, fg='cyan')} {click.style('py->rs', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)}")
-            return False
+                out(f"{click.style(case_name, fg='cyan')} {click.style('py->rs', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)}")
+            return False, lines
 
         if verbose:
-            print(f"  {click.style('✓', fg='green', bold=True)} Python encode -> Rust decode: PASSED")
+            out(f"  {click.style('✓', fg='green', bold=True)} Python encode -> Rust decode: PASSED")
         else:
             results.append(('py->rs', True, None))
     except Exception as e:
         if verbose:
-            print(f"  {click.style('✗', fg='red', bold=True)} Python encode -> Rust decode: {e}")
+            out(f"  {click.style('✗', fg='red', bold=True)} Python encode -> Rust decode: {e}")
         else:
-            print(f"{click.style(case_name, fg='cyan')} {click.style('py->rs', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)} ({e})")
-        return False
+            out(f"{click.style(case_name, fg='cyan')} {click.style('py->rs', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)} ({e})")
+        return False, lines
 
     # Test 2: Rust encode -> Python decode
     try:
-        decoded_from_py = test_rs_encode_py_decode(test_values, case_file, rust_binary, verbose)
+        decoded_from_py = test_rs_encode_py_decode(test_values, case_file, harness, verbose)
         if verbose:
-            print(f"  Rs->Py decoded: {decoded_from_py}")
+            out(f"  Rs->Py decoded: {decoded_from_py}")
 
         # Compare each value (compare original test values with decoded)
         all_match = True
         for i, (original, decoded) in enumerate(zip(test_values, decoded_from_py)):
-            if not compare_values(original, decoded, f"test[{i}]", py_compare):
+            if not compare_values(original, decoded, f"test[{i}]", compare_code, out):
                 all_match = False
                 break
 
         if not all_match:
             if verbose:
-                print(f"  {click.style('✗', fg='red', bold=True)} Rust encode -> Python decode: FAILED")
+                out(f"  {click.style('✗', fg='red', bold=True)} Rust encode -> Python decode: FAILED")
             else:
-                print(f"{click.style(case_name, fg='cyan')} {click.style('rs->py', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)}")
-            return False
+                out(f"{click.style(case_name, fg='cyan')} {click.style('rs->py', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)}")
+            return False, lines
 
         if verbose:
-            print(f"  {click.style('✓', fg='green', bold=True)} Rust encode -> Python decode: PASSED")
+            out(f"  {click.style('✓', fg='green', bold=True)} Rust encode -> Python decode: PASSED")
         else:
             results.append(('rs->py', True, None))
     except Exception as e:
         if verbose:
-            print(f"  {click.style('✗', fg='red', bold=True)} Rust encode -> Python decode: {e}")
+            out(f"  {click.style('✗', fg='red', bold=True)} Rust encode -> Python decode: {e}")
         else:
-            print(f"{click.style(case_name, fg='cyan')} {click.style('rs->py', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)} ({e})")
-        return False
+            out(f"{click.style(case_name, fg='cyan')} {click.style('rs->py', fg='yellow')} {click.style('✗ FAILED', fg='red', bold=True)} ({e})")
+        return False, lines
 
     # Print compact results for non-verbose mode
     if not verbose:
         for direction, passed, error in results:
             status = click.style('✓ PASSED', fg='green', bold=True)
-            print(f"{click.style(case_name, fg='cyan')} {click.style(direction, fg='yellow')} {status}")
+            out(f"{click.style(case_name, fg='cyan')} {click.style(direction, fg='yellow')} {status}")
     else:
-        print(f"  {click.style('✅ All tests PASSED', fg='green', bold=True)} for {case_name}")
+        out(f"  {click.style('✅ All tests PASSED', fg='green', bold=True)} for {case_name}")
 
-    return True
+    return True, lines
 
 
 @click.command()
@@ -244,7 +424,19 @@ def run_test_case(case_file: Path, rust_binary: Path, verbose: bool = False):
     is_flag=True,
     help="Enable verbose output showing original and decoded values"
 )
-def main(verbose: bool):
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Number of test cases to run concurrently (default: CPU count)"
+)
+@click.option(
+    "--jsonify-cases",
+    is_flag=True,
+    help="Write a JSON copy alongside each YAML case and exit; later runs load the JSON"
+)
+def main(verbose: bool, jobs: int, jsonify_cases: bool):
     """Run all test cases for cross-language tobytes compatibility."""
     test_dir = Path(__file__).parent
     cases_dir = test_dir / "cases"
@@ -253,23 +445,53 @@ def main(verbose: bool):
         print(f"Error: Test cases directory not found: {cases_dir}")
         sys.exit(1)
 
-    rust_binary = build_rust_binary()
-
     test_cases = sorted(cases_dir.glob("*.yaml"))
     if not test_cases:
         print(f"No test cases found in {cases_dir}")
         sys.exit(1)
 
+    if jsonify_cases:
+        write_json_cases(test_cases)
+        return
+
+    rust_binary = build_rust_binary()
+
     print(f"Found {len(test_cases)} test case(s)")
 
     passed = 0
     failed = 0
 
-    for case_file in test_cases:
-        if run_test_case(case_file, rust_binary, verbose):
-            passed += 1
-        else:
-            failed += 1
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # Each worker thread pipes to its own persistent Rust harness
+    local = threading.local()
+    harnesses = []
+    harnesses_lock = threading.Lock()
+
+    def run_in_worker(case_file: Path) -> tuple[bool, list]:
+        harness = getattr(local, 'harness', None)
+        if harness is None:
+            harness = local.harness = HarnessClient(rust_binary)
+            with harnesses_lock:
+                harnesses.append(harness)
+        return run_test_case(case_file, harness, verbose)
+
+    try:
+        with cf.ThreadPoolExecutor(max_workers=jobs) as ex:
+            futures = {ex.submit(run_in_worker, case_file): case_file for case_file in test_cases}
+            # Printed here, one case at a time, so output from concurrent cases doesn't interleave
+            for fut in cf.as_completed(futures):
+                case_passed, lines = fut.result()
+                for line in lines:
+                    print(line)
+                if case_passed:
+                    passed += 1
+                else:
+                    failed += 1
+    finally:
+        for harness in harnesses:
+            harness.close()
 
     print(f"\n{'='*50}")
     print(f"Results: {passed} passed, {failed} failed out of {len(test_cases)} total")